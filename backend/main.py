@@ -1,37 +1,31 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel
 
-# ----------------- USER MODELS -----------------
-class SignupModel(BaseModel):
-    fullName: str
-    email: EmailStr
-    password: str
-
-class LoginModel(BaseModel):
-    email: EmailStr
-    password: str
-
-# ----------------- MYSQL SETUP -----------------
-from services.database import db, cursor
-
-# ----------------- AUTH UTILS -----------------
-import bcrypt
-
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
-
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+# ----------------- DATABASE + AUTH -----------------
+from services.database import get_pool_stats
+from services.security import shutdown_hash_pool
+from services.auth import router as auth_router, SessionMiddleware
 
 # ----------------- FASTAPI SETUP -----------------
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from typing import List, Optional
+import asyncio
 import json
 
 # Import services
-from services.pdf_reader import extract_text_from_pdf, chunk_text
-from services.embeddings import get_embeddings_for_chunks
-from services.vector_store import store_embeddings, query_similar_chunks, clear_index, get_or_create_index
-from services.qa_engine import generate_answer_with_groq
+from services.embeddings import embed_query, aget_embeddings_batch, shutdown_encode_pool
+from services.vector_store import (
+    query_similar_chunks, query_embeddings_batch, clear_index, init_vector_store, vector_count, get_store_info,
+    build_filter, corpus_version,
+)
+from services.qa_engine import answer_with_sources, stream_answer_with_groq
+from services.answer_cache import get_answer_cache, get_answer_cache_stats, cache_key
+from services.executor import run_io, shutdown_pools
+from services.ingest import ingest_pdf, submit_ingest_job, get_job, IngestError
+from services.quiz import generate_quizzes, generate_quiz_batch, get_quiz_stats, QuizError, QuizValidationError
+from services.llm_client import close_llm_client, LLMError
+from services import metrics
 
 app = FastAPI(title="Smart Campus API (Groq + Chroma)", version="1.3.0")
 
@@ -44,6 +38,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Verifies bearer tokens in-process; routes read request.state.user
+app.add_middleware(SessionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+app.include_router(auth_router)
+
+@app.on_event("startup")
+async def _warm_vector_store():
+    # Open the (possibly persistent) collection in the background; startup does not wait for it.
+    async def warm():
+        try:
+            await run_io(init_vector_store)
+        except Exception as e:
+            print(f"[WARN] Vector store warm-up failed: {e}")
+    app.state.vector_store_warmup = asyncio.get_running_loop().create_task(warm())
+
+@app.on_event("shutdown")
+async def _shutdown_pools():
+    await close_llm_client()
+    shutdown_hash_pool()
+    shutdown_encode_pool()
+    shutdown_pools(wait=False)
+
 # ----------------- ROUTE MODELS -----------------
 class ChunkRequest(BaseModel):
     text: str
@@ -54,56 +70,53 @@ class ChunkRequest(BaseModel):
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 5
+    course_id: Optional[str] = None
+    doc_id: Optional[str] = None
+    owner_id: Optional[str] = None
 
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 5
+    course_id: Optional[str] = None
+    doc_id: Optional[str] = None
+    owner_id: Optional[str] = None
 
-# ============================================================
-#                AUTH ROUTES (LOGIN + SIGNUP)
-# ============================================================
+class QuizRequest(BaseModel):
+    topic: str
+    doc_id: Optional[str] = None
+    course_id: Optional[str] = None
+    num_questions: int = 5
+    num_sets: int = 1
 
-@app.post("/signup")
-def signup(data: SignupModel):
-    # Check if email exists
-    cursor.execute("SELECT * FROM users WHERE email = %s", (data.email,))
-    existing = cursor.fetchone()
+class QuizBatchRequest(BaseModel):
+    items: List[QuizRequest]
 
-    if existing:
-        raise HTTPException(status_code=400, detail="Email already registered")
 
-    # Hash password
-    hashed_pw = hash_password(data.password)
+QUIZ_BATCH_MAX_ITEMS = 50
 
-    # Insert new user
-    cursor.execute(
-        "INSERT INTO users (fullName, email, password) VALUES (%s, %s, %s)",
-        (data.fullName, data.email, hashed_pw)
-    )
-    db.commit()
 
-    return {
-        "status": "success",
-        "message": "User registered successfully"
-    }
+def validate_quiz_request(req: QuizRequest):
+    if not req.topic.strip():
+        raise HTTPException(status_code=400, detail="Topic cannot be empty")
+    if not 1 <= req.num_questions <= 20 or not 1 <= req.num_sets <= 10:
+        raise HTTPException(status_code=400, detail="num_questions must be 1-20 and num_sets 1-10")
 
 
-@app.post("/login")
-def login(data: LoginModel):
-    # Fetch user
-    cursor.execute("SELECT * FROM users WHERE email = %s", (data.email,))
-    user = cursor.fetchone()
+def request_filter(req):
+    """Metadata filter from a request's course_id / doc_id / owner_id (None if unscoped)."""
+    try:
+        return build_filter(course_id=req.course_id, doc_id=req.doc_id, owner_id=req.owner_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid email or password")
 
-    # Check password
-    if not verify_password(data.password, user["password"]):
-        raise HTTPException(status_code=401, detail="Invalid email or password")
+# ============================================================
+#                AUTH (routes in services/auth.py)
+# ============================================================
 
-    return {
-        "status": "success",
-        "message": "Login successful",
-        "user_id": user["id"],
-        "fullName": user["fullName"]
-    }
+@app.get("/db-stats")
+def db_stats():
+    return get_pool_stats()
 
 
 # ============================================================
@@ -120,33 +133,52 @@ def health():
     return {"status": "healthy"}
 
 @app.post("/upload")
-async def upload_and_process_pdf(file: UploadFile = File(...), chunk_size: int = 512, overlap: int = 50):
+async def upload_and_process_pdf(file: UploadFile = File(...), chunk_size: int = 512, overlap: int = 50,
+                                 background: bool = False, doc_id: Optional[str] = None,
+                                 course_id: Optional[str] = None, owner_id: Optional[str] = None):
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
 
     pdf_bytes = await file.read()
-    text = extract_text_from_pdf(pdf_bytes)
-
-    if not text.strip():
-        raise HTTPException(status_code=400, detail="No text extracted from PDF")
-
-    chunks = chunk_text(text, chunk_size=chunk_size, overlap=overlap, method="word")
-    embeddings = get_embeddings_for_chunks(chunks, use_cache=True, batch=True)
-    saved = store_embeddings(embeddings, chunks)
+    tags = {"course_id": course_id, "owner_id": owner_id}
+
+    if background:
+        job = submit_ingest_job(pdf_bytes, file.filename, chunk_size=chunk_size, overlap=overlap,
+                                doc_id=doc_id, tags=tags)
+        return {
+            "filename": file.filename,
+            "doc_id": job.doc_id,
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}",
+            "status": "queued"
+        }
+
+    try:
+        result = await ingest_pdf(pdf_bytes, chunk_size=chunk_size, overlap=overlap,
+                                  filename=file.filename, doc_id=doc_id, tags=tags)
+    except IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     return {
         "filename": file.filename,
-        "text_length": len(text),
-        "chunks_created": len(chunks),
-        "vectors_stored": saved,
+        **result,
         "status": "success"
     }
 
 
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
 @app.post("/query")
 async def query_endpoint(req: QueryRequest):
-    qvec = get_embeddings_for_chunks([req.query], use_cache=True, batch=False)[0]
-    matches = query_similar_chunks(qvec, top_k=req.top_k)
+    where = request_filter(req)
+    qvec = await embed_query(req.query)
+    matches = await run_io(query_similar_chunks, qvec, top_k=req.top_k, where=where)
 
     formatted = []
     for i, m in enumerate(matches):
@@ -160,13 +192,103 @@ async def query_endpoint(req: QueryRequest):
     return {"query": req.query, "results_count": len(formatted), "results": formatted}
 
 
+@app.post("/query/batch")
+async def batch_query_endpoint(req: BatchQueryRequest):
+    if not req.queries:
+        raise HTTPException(status_code=400, detail="queries cannot be empty")
+    if any(not q.strip() for q in req.queries):
+        raise HTTPException(status_code=400, detail="queries cannot contain empty strings")
+
+    where = request_filter(req)
+    qvecs = await aget_embeddings_batch(req.queries, use_cache=True)
+    rows_per_query = await run_io(query_embeddings_batch, qvecs, top_k=req.top_k, where=where)
+
+    results = []
+    for query, rows in zip(req.queries, rows_per_query):
+        formatted = [{
+            "rank": i + 1,
+            "id": r.get("id"),
+            "score": r.get("score"),
+            "text": r["metadata"].get("text") if r.get("metadata") else ""
+        } for i, r in enumerate(rows)]
+        results.append({"query": query, "results_count": len(formatted), "results": formatted})
+
+    return {"queries_count": len(results), "results": results}
+
+
 @app.post("/answer")
 async def answer_endpoint(req: QueryRequest):
     if not req.query.strip():
         raise HTTPException(status_code=400, detail="Question cannot be empty")
 
-    answer = generate_answer_with_groq(req.query, top_k=req.top_k)
-    return {"question": req.query, "answer": answer}
+    where = request_filter(req)
+    # Version captured before retrieval: an upload finishing mid-answer makes this entry stale.
+    key = cache_key(req.query, req.top_k, where, corpus_version())
+    cache = get_answer_cache()
+    entry = cache.get(key)
+    if entry is not None:
+        return {"question": req.query, "answer": entry["answer"], "cached": True}
+
+    qvec = await embed_query(req.query)
+    answer, sources = await answer_with_sources(req.query, top_k=req.top_k, query_embedding=qvec, where=where)
+    # Sources are kept with the answer so a cached /answer/stream reply can still send them.
+    cache.put(key, {"answer": answer, "sources": sources})
+    return {"question": req.query, "answer": answer, "cached": False}
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/answer/stream")
+async def answer_stream_endpoint(req: QueryRequest):
+    """Server-sent events: `sources` (retrieved chunks), `token` deltas, then `done`."""
+    if not req.query.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+
+    where = request_filter(req)
+    key = cache_key(req.query, req.top_k, where, corpus_version())
+    cache = get_answer_cache()
+    cached = cache.get(key)
+
+    async def events():
+        if cached is not None:
+            yield sse_event("sources", cached["sources"])
+            yield sse_event("token", {"delta": cached["answer"]})
+            yield sse_event("done", {"answer": cached["answer"], "cached": True})
+            return
+
+        sources = []
+        try:
+            qvec = await embed_query(req.query)
+            async for event, data in stream_answer_with_groq(req.query, top_k=req.top_k,
+                                                             query_embedding=qvec, where=where):
+                if event == "sources":
+                    sources = data
+                elif event == "token":
+                    data = {"delta": data}
+                elif event == "done":
+                    cache.put(key, {"answer": data["answer"], "sources": sources})
+                yield sse_event(event, data)
+        except Exception as e:
+            print(f"[WARN] Streaming answer failed: {e}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/answer/cache-stats")
+def answer_cache_stats():
+    return get_answer_cache_stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus text format; disabled with METRICS_ENABLED=false."""
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.post("/clear-index")
@@ -177,50 +299,75 @@ def clear_index_route():
 
 @app.get("/vector-count")
 def vector_count_route():
-    col = get_or_create_index()
-    return {"count": col.count()}
+    return {"count": vector_count(), **get_store_info()}
 
 
-@app.post("/generate-quiz")
-async def generate_quiz(topic: str = Form(...), file: UploadFile = File(...)):
-    pdf_bytes = await file.read()
-    text = extract_text_from_pdf(pdf_bytes)
-
-    if not text.strip():
-        raise HTTPException(400, "PDF has no readable text")
+@app.post("/quiz")
+async def quiz_endpoint(req: QuizRequest):
+    """Quiz sets on a topic from already-indexed chunks (optionally one document / course)."""
+    validate_quiz_request(req)
+    try:
+        sets = await generate_quizzes(req.topic, doc_id=req.doc_id, course_id=req.course_id,
+                                      num_questions=req.num_questions, num_sets=req.num_sets)
+    except (QuizValidationError, LLMError) as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    except QuizError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
-    limited_text = text[:2500]
-
-    prompt = f"""
-You MUST return ONLY valid JSON.
+    return {
+        "topic": req.topic,
+        "doc_id": req.doc_id,
+        "sets_count": len(sets),
+        "sets_failed": sum("error" in s for s in sets),
+        "quiz_sets": sets,
+        "status": "success"
+    }
 
-Create 5 MCQs based on the topic and PDF.
 
-USER TOPIC: "{topic}"
+@app.post("/quiz/batch")
+async def quiz_batch_endpoint(req: QuizBatchRequest):
+    """Many topics / documents at once (e.g. a whole course); failures are reported per item."""
+    if not req.items:
+        raise HTTPException(status_code=400, detail="items cannot be empty")
+    if len(req.items) > QUIZ_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {QUIZ_BATCH_MAX_ITEMS} items per batch")
+    for item in req.items:
+        validate_quiz_request(item)
 
-PDF CONTENT:
-{limited_text}
-"""
+    batch = await generate_quiz_batch([item.model_dump() for item in req.items])
+    return {**batch, "status": "success"}
 
-    quiz_text = generate_answer_with_groq(prompt)
 
-    import re
-    match = re.search(r"\[.*\]", quiz_text, re.DOTALL)
-    quizzes = None
+@app.get("/quiz/stats")
+def quiz_stats():
+    return get_quiz_stats()
 
-    if match:
-        try:
-            quizzes = json.loads(match.group(0))
-        except:
-            quizzes = None
 
-    if quizzes is None:
-        quizzes = [{"raw_output": quiz_text}]
+@app.post("/generate-quiz")
+async def generate_quiz(topic: str = Form(...), file: UploadFile = File(...)):
+    """Older upload-and-quiz form: indexes the PDF (a known one is not re-parsed), then quizzes it like /quiz."""
+    if not file.filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    if not topic.strip():
+        raise HTTPException(status_code=400, detail="Topic cannot be empty")
 
+    pdf_bytes = await file.read()
+    try:
+        result = await ingest_pdf(pdf_bytes, filename=file.filename)
+        sets = await generate_quizzes(topic, doc_id=result["doc_id"])
+    except IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (QuizValidationError, LLMError) as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    except QuizError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    quizzes = sets[0]["questions"]
     return {
         "filename": file.filename,
+        "doc_id": result["doc_id"],
         "topic": topic,
-        "quiz_count": len(quizzes) if isinstance(quizzes, list) else 0,
+        "quiz_count": len(quizzes),
         "quizzes": quizzes,
         "status": "success"
     }
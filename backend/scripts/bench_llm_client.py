@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""Exercise services/llm_client.py against the local mock LLM server.
+
+Fires concurrent completions (with injected 429/503 failures) plus one
+streamed completion and reports latency, retries and how many TCP
+connections the server saw, which shows keep-alive reuse.
+
+Run: python scripts/bench_llm_client.py [requests] [fail_rate]
+"""
+import os
+import sys
+import time
+import asyncio
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from mock_llm_server import start_server, ANSWER
+from services.llm_client import LLMClient
+
+
+async def run(n_requests: int, base_url: str):
+    client = LLMClient(base_url=base_url, api_key="test", model="mock", max_concurrent=8, max_retries=5)
+    messages = [{"role": "user", "content": "ping"}]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(client.chat(messages) for _ in range(n_requests)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    errors = [r for r in results if isinstance(r, Exception)]
+    wrong = [r for r in results if not isinstance(r, Exception) and r != ANSWER]
+
+    deltas = [d async for d in client.stream_chat(messages)]
+    await client.aclose()
+    return elapsed, errors, wrong, "".join(deltas), client.stats()
+
+
+def main():
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    fail_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+
+    server, state = start_server(0, latency_ms=20, fail_rate=fail_rate)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/openai/v1"
+    print(f"=== LLM client against mock server ({n_requests} requests, fail rate {fail_rate}) ===\n")
+
+    elapsed, errors, wrong, streamed, stats = asyncio.run(run(n_requests, base_url))
+    server.shutdown()
+
+    print(f"Completions:   {n_requests - len(errors)}/{n_requests} ok in {elapsed:.2f}s "
+          f"({n_requests / elapsed:.1f} req/s)")
+    print(f"Client stats:  {stats}")
+    print(f"Server stats:  {state.stats()}")
+
+    if errors or wrong:
+        print(f"❌ {len(errors)} failed, {len(wrong)} wrong answers (first error: {errors[0] if errors else None})")
+        sys.exit(1)
+    if streamed != ANSWER:
+        print(f"❌ Streamed answer differs: {streamed!r}")
+        sys.exit(1)
+    print("\n✅ All completions succeeded; connections were reused across requests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""Benchmark password verification (the CPU cost of /login) per bcrypt cost factor.
+
+For each cost factor, verifies N logins concurrently through the bounded
+hash pool in services/security.py and reports logins/sec, along with how
+long a trivial coroutine took to get scheduled meanwhile. That delay shows
+whether the event loop stayed responsive.
+
+Run: python scripts/bench_login.py [logins] [rounds,...]
+     e.g. python scripts/bench_login.py 64 4,8,10,12
+"""
+import os
+import sys
+import time
+import asyncio
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("SESSION_SECRET", "bench")
+from services import security
+
+
+async def loop_lag(stop: asyncio.Event) -> float:
+    """Worst delay seen by a 5 ms ticker while logins run."""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.005)
+        worst = max(worst, time.perf_counter() - start - 0.005)
+    return worst
+
+
+async def bench(rounds: int, logins: int):
+    hashed = security.hash_password_sync("correct horse battery staple", rounds)
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(loop_lag(stop))
+    start = time.perf_counter()
+    results = await asyncio.gather(*(security.verify_password("correct horse battery staple", hashed)
+                                     for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    lag = await lag_task
+    assert all(results)
+    return elapsed, lag
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    rounds_list = [int(r) for r in sys.argv[2].split(",")] if len(sys.argv) > 2 else [4, 8, 10, 12]
+
+    print(f"=== Login verification benchmark ({logins} concurrent logins, "
+          f"{security.AUTH_HASH_WORKERS} hash workers) ===\n")
+    print(f"{'cost':>4} {'ms/login':>10} {'logins/sec':>12} {'loop lag ms':>12}")
+    for rounds in rounds_list:
+        elapsed, lag = asyncio.run(bench(rounds, logins))
+        print(f"{rounds:>4} {1000 * elapsed / logins:>10.2f} {logins / elapsed:>12.1f} {1000 * lag:>12.2f}")
+    security.shutdown_hash_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""Benchmark serial vs. parallel PDF text extraction.
+
+Builds a synthetic multi-page PDF with PyMuPDF (same approach as
+check_pdf_chunking.py) and reports pages/sec for each worker count. The
+parallel runs extract page windows from a temp-file path, as the ingest
+pipeline does, so the PDF is not pickled into a worker per window.
+
+Run: python scripts/bench_pdf_extraction.py [pages] [max_workers] [window]
+"""
+import os
+import sys
+import time
+import tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import fitz
+from services import pdf_reader
+
+PARAGRAPH = (
+    "A database management system stores, retrieves and updates data while "
+    "enforcing integrity constraints. Normalisation removes redundancy by "
+    "splitting relations; transactions guarantee atomicity, consistency, "
+    "isolation and durability across concurrent users. "
+)
+
+
+def make_sample_pdf_bytes(pages: int) -> bytes:
+    doc = fitz.open()
+    rect = fitz.Rect(72, 72, 540, 720)
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(rect, f"Page {i + 1}\n" + PARAGRAPH * 8, fontsize=10)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def extract_windowed(pool, path: str, pages: int, window: int) -> str:
+    windows = [(start, min(start + window, pages)) for start in range(0, pages, window)]
+    parts = pool.map(pdf_reader.extract_pages, [path] * len(windows), *zip(*windows))
+    return "\n".join(page for part in parts for page in part if page)
+
+
+def bench(label, fn, pages, repeats=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<22} {best:8.3f}s  {pages / best:10.1f} pages/sec")
+    return result
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else max(2, os.cpu_count() or 1)
+    window = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+    if max_workers < 2:
+        print("⚠️  Skipping benchmark: parallel extraction needs max_workers >= 2")
+        return
+
+    print(f"=== PDF extraction benchmark ({pages} pages, up to {max_workers} workers) ===\n")
+    pdf_bytes = make_sample_pdf_bytes(pages)
+    print(f"Synthetic PDF: {len(pdf_bytes) / 1024:.0f} KiB\n")
+
+    reference = bench("serial", lambda: pdf_reader.extract_text_from_pdf(pdf_bytes), pages)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(pdf_bytes)
+        path = f.name
+
+    workers = 2
+    ctx = multiprocessing.get_context("spawn")
+    while workers <= max_workers:
+        # Warm pool: measure extraction, not process start-up.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            list(pool.map(abs, range(workers)))
+            text = bench(
+                f"parallel x{workers}",
+                lambda: extract_windowed(pool, path, pages, window),
+                pages,
+            )
+        if text != reference:
+            os.remove(path)
+            print(f"❌ parallel x{workers} output differs from serial extraction")
+            sys.exit(1)
+        workers *= 2
+    os.remove(path)
+
+    print("\n✅ Parallel output matches serial extraction")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""Concurrency check for the pooled database layer (services/database.py).
+
+Runs many threads doing signup-style insert + lookup through db_cursor()
+with a pool smaller than the thread count, then closes an idle connection
+behind the pool's back to check that the next checkout replaces it.
+
+Defaults to the SQLite shim in a temp file; set DB_BACKEND=mysql (and the
+MYSQL_* variables) to run the same check against a MySQL server.
+
+Run: python scripts/check_db_pool.py [threads] [ops_per_thread]
+"""
+import os
+import sys
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", os.path.join(tempfile.mkdtemp(), "pool_check.db"))
+os.environ.setdefault("MYSQL_POOL_SIZE", "4")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services import database
+
+
+def worker(tid: int, ops: int, run_id: str) -> int:
+    done = 0
+    for i in range(ops):
+        email = f"pool-{run_id}-{tid}-{i}@example.com"
+        with database.db_cursor(commit=True) as cur:
+            cur.execute("INSERT INTO users (fullName, email, password) VALUES (%s, %s, %s)",
+                        (f"User {tid}", email, "x"))
+        with database.db_cursor() as cur:
+            cur.execute("SELECT id FROM users WHERE email = %s", (email,))
+            if cur.fetchone() is not None:
+                done += 1
+    return done
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    ops = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    run_id = str(int(time.time() * 1000))
+    pool = database.get_pool()
+    print(f"=== DB pool check ({database.DB_BACKEND}, pool {pool.size}, {threads} threads x {ops} ops) ===\n")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as ex:
+        found = sum(ex.map(lambda t: worker(t, ops, run_id), range(threads)))
+    elapsed = time.perf_counter() - start
+    print(f"Round trips:  {found}/{threads * ops} users written and read back in {elapsed:.2f}s "
+          f"({2 * threads * ops / elapsed:.0f} queries/s)")
+
+    # Drop a pooled connection underneath the pool, as a server restart would.
+    with database.get_connection() as conn:
+        conn.close()
+    with database.db_cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS n FROM users WHERE email LIKE %s", (f"pool-{run_id}-%",))
+        count = cur.fetchone()["n"]
+    stats = database.get_pool_stats()
+    print(f"Pool stats:   {stats}")
+
+    if found != threads * ops or count != threads * ops:
+        print("❌ Lost writes or reads under concurrency")
+        sys.exit(1)
+    if stats["reconnects"] < 1:
+        print("❌ Dropped connection was not replaced")
+        sys.exit(1)
+    print("\n✅ Pool served concurrent requests and recovered a dropped connection")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""Local stand-in for the Groq chat completions endpoint.
+
+Serves POST .../chat/completions (plain and stream=true SSE) over HTTP/1.1
+keep-alive, with optional latency and injected 429/503 failures so the
+retry path of services/llm_client.py can be exercised. Quiz prompts get a
+JSON quiz, truncated with probability --bad-json-rate to exercise quiz
+validation retries.
+
+Run:  python scripts/mock_llm_server.py [--port 8765] [--latency-ms 50] [--fail-rate 0.2] [--bad-json-rate 0.2]
+Then: GROQ_BASE_URL=http://127.0.0.1:8765/openai/v1 uvicorn main:app
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "This is a mock answer from the local LLM server. It streams one word at a time."
+QUIZ = [
+    {"question": "What does normalisation remove?", "options": ["Redundancy", "Indexes", "Users", "Tables"],
+     "answer": "Redundancy", "explanation": "Splitting relations removes redundant data."},
+    {"question": "Which property keeps transactions all-or-nothing?",
+     "options": ["Atomicity", "Consistency", "Isolation", "Durability"],
+     "answer": "Atomicity", "explanation": "Atomic transactions either fully apply or not at all."},
+]
+
+
+class MockState:
+    def __init__(self, latency_ms: float = 0.0, fail_rate: float = 0.0, bad_json_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.fail_rate = fail_rate
+        self.bad_json_rate = bad_json_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.failures = 0
+        self.bad_replies = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "injected_failures": self.failures,
+                    "bad_replies": self.bad_replies, "connections": len(self.connections)}
+
+    def completion_for(self, body) -> str:
+        """Canned reply: a JSON array of the requested number of questions for quiz prompts, ANSWER otherwise."""
+        prompt = " ".join(m.get("content", "") for m in body.get("messages", []))
+        if "valid JSON" not in prompt:
+            return ANSWER
+        match = re.search(r"Create (\d+) multiple-choice", prompt)
+        count = int(match.group(1)) if match else len(QUIZ)
+        reply = json.dumps([QUIZ[i % len(QUIZ)] for i in range(count)])
+        with self.lock:
+            bad = self.rng.random() < self.bad_json_rate
+            self.bad_replies += int(bad)
+        return reply[:len(reply) // 2] if bad else reply
+
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            with state.lock:
+                state.requests += 1
+                state.connections.add(self.client_address)
+                fail = state.rng.random() < state.fail_rate
+                if fail:
+                    state.failures += 1
+            if not self.path.endswith("/chat/completions"):
+                self._send_json(404, {"error": "not found"})
+                return
+            if state.latency_ms:
+                time.sleep(state.latency_ms / 1000)
+            if fail:
+                status = 429 if state.rng.random() < 0.5 else 503
+                self._send_json(status, {"error": "injected failure"}, {"Retry-After": "0"})
+                return
+
+            model = body.get("model", "mock")
+            if not body.get("stream"):
+                self._send_json(200, {
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": state.completion_for(body)},
+                                 "finish_reason": "stop"}],
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def chunk(data: str):
+                raw = f"data: {data}\n\n".encode()
+                self.wfile.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+                self.wfile.flush()
+
+            for i, word in enumerate(state.completion_for(body).split(" ")):
+                delta = word if i == 0 else " " + word
+                chunk(json.dumps({"model": model, "choices": [{"index": 0, "delta": {"content": delta}}]}))
+            chunk("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def start_server(port: int = 0, latency_ms: float = 0.0, fail_rate: float = 0.0, bad_json_rate: float = 0.0):
+    """Start in a daemon thread; returns (server, state). port=0 picks a free port."""
+    state = MockState(latency_ms, fail_rate, bad_json_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--bad-json-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, state = start_server(args.port, args.latency_ms, args.fail_rate, args.bad_json_rate)
+    print(f"Mock LLM server on http://127.0.0.1:{server.server_address[1]}/openai/v1 "
+          f"(latency {args.latency_ms} ms, fail rate {args.fail_rate})")
+    try:
+        while True:
+            time.sleep(5)
+            print(state.stats())
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
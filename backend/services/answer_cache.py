@@ -0,0 +1,231 @@
+# backend/services/answer_cache.py
+"""In-memory cache of generated answers for /answer.
+
+Keys are (normalized question, top_k, metadata filter, corpus version).
+The corpus version comes from vector_store and is bumped on every write to
+the collection, so an upload, delete or clear makes all earlier answers
+stale; they are dropped the first time the cache sees the new version.
+Entries also expire after ANSWER_CACHE_TTL_SECONDS, and the least recently
+used entry is evicted once ANSWER_CACHE_MAX_ENTRIES is reached.
+
+SemanticAnswerCache sits behind retrieval in generate_answer_with_groq and
+catches paraphrases: it reuses an answer when the new question's embedding
+is within SEMANTIC_CACHE_THRESHOLD cosine of a recent question *and* the
+same set of chunks was retrieved, so the LLM would see the same context.
+Chunk ids are content hashes, so an unchanged id set means unchanged text.
+"""
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 0 disables the cache
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "600"))
+# Questions kept for paraphrase matching (0 disables) and the cosine needed to reuse an answer
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "256"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+
+_PUNCT_EDGES = re.compile(r"^[\s\"'`]+|[\s\"'`?!.]+$")
+
+
+def normalize_question(question: str) -> str:
+    """Case-fold, collapse whitespace and drop surrounding quotes / trailing ?!."""
+    return _PUNCT_EDGES.sub("", " ".join(question.split()).casefold())
+
+
+def cache_key(question: str, top_k: int, where: Optional[Dict[str, Any]], version: int) -> Tuple:
+    return (normalize_question(question), top_k, json.dumps(where or {}, sort_keys=True), version)
+
+
+class AnswerCache:
+    """TTL + LRU cache bounded by entry count; entries of older corpus versions are flushed."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._version = None
+        self._entries: "OrderedDict[Tuple, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _sync_version(self, version: int) -> bool:
+        """Flush on a newer corpus version; False if `version` is already stale."""
+        if self._version is None or version > self._version:
+            if self._entries:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+            self._version = version
+        return version == self._version
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._sync_version(key[-1])
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, answer = entry
+            if self.ttl_seconds > 0 and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def put(self, key: Tuple, answer: Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            # An answer built before a later write must not be cached under the new corpus.
+            if not self._sync_version(key[-1]):
+                return
+            self._entries[key] = (time.monotonic(), answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "corpus_version": self._version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+class SemanticAnswerCache:
+    """Ring buffer of recent question embeddings (one float32 matrix) with their answers."""
+
+    def __init__(self, size: int, threshold: float, ttl_seconds: float):
+        self.size = size
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.near_misses = 0  # similar question, different chunks retrieved
+        self._matrix: Optional[np.ndarray] = None
+        self._chunk_sets: List[Optional[FrozenSet[str]]] = [None] * max(0, size)
+        self._answers: List[Optional[str]] = [None] * max(0, size)
+        self._stored_at = np.zeros(max(0, size), dtype=np.float64)
+        self._filled = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    @staticmethod
+    def _unit(vec) -> np.ndarray:
+        vec = np.asarray(vec, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def get(self, question_embedding, chunk_ids) -> Optional[str]:
+        if not self.enabled:
+            return None
+        q = self._unit(question_embedding)
+        chunk_set = frozenset(chunk_ids)
+        with self._lock:
+            if self._matrix is None or self._filled == 0 or self._matrix.shape[1] != len(q):
+                self.misses += 1
+                return None
+            sims = self._matrix[:self._filled] @ q
+            now = time.monotonic()
+            similar = False
+            for slot in np.argsort(-sims):
+                if sims[slot] < self.threshold:
+                    break
+                if self.ttl_seconds > 0 and now - self._stored_at[slot] > self.ttl_seconds:
+                    continue
+                similar = True
+                if self._chunk_sets[slot] == chunk_set:
+                    self.hits += 1
+                    return self._answers[slot]
+            self.misses += 1
+            if similar:
+                self.near_misses += 1
+            return None
+
+    def put(self, question_embedding, chunk_ids, answer: str) -> None:
+        if not self.enabled:
+            return
+        q = self._unit(question_embedding)
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != len(q):
+                self._matrix = np.zeros((self.size, len(q)), dtype=np.float32)
+                self._filled = self._next = 0
+            slot = self._next
+            self._matrix[slot] = q
+            self._chunk_sets[slot] = frozenset(chunk_ids)
+            self._answers[slot] = answer
+            self._stored_at[slot] = time.monotonic()
+            self._next = (slot + 1) % self.size
+            self._filled = min(self._filled + 1, self.size)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._filled = self._next = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._filled,
+                "size": self.size,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "near_misses": self.near_misses,
+                "llm_calls_saved": self.hits,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+_cache = AnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS)
+_semantic_cache = SemanticAnswerCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD, ANSWER_CACHE_TTL_SECONDS)
+
+
+def get_answer_cache() -> AnswerCache:
+    return _cache
+
+
+def get_semantic_cache() -> SemanticAnswerCache:
+    return _semantic_cache
+
+
+def get_answer_cache_stats() -> Dict[str, Any]:
+    return {"exact": _cache.stats(), "semantic": _semantic_cache.stats()}
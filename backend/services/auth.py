@@ -1,52 +1,83 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from bson import ObjectId
-from .database import db
-from .utils import hash_password, verify_password, create_jwt  # <-- using your utility functions
+# backend/services/auth.py
+"""Signup / login routes and stateless session checks.
+
+Users live in the async UserStore from services/users.py (MySQL, the SQLite
+shim or memory). /login issues a signed token carrying the user's id, name
+and email. SessionMiddleware verifies the `Authorization: Bearer` header of
+every request in-process and puts the claims on `request.state.user`, so
+authenticated routes (`Depends(current_user)`) never query the database.
+"""
+from typing import Any, Dict
+from fastapi import APIRouter, Depends, HTTPException, Request
+
+from services.database import DatabaseError
+from services.models import SignupModel, LoginModel
+from services.users import get_user_store, UserExistsError
+from services.security import (
+    hash_password, verify_password, create_session_token, verify_session_token,
+    SessionError, SESSION_TTL_SECONDS,
+)
 
 router = APIRouter()
 
 
-# ------------------ MODELS ---------------------
+# ------------------ MIDDLEWARE ---------------------
 
-class SignupModel(BaseModel):
-    username: str
-    email: str
-    password: str
+# Puts verified claims (or the auth error) on request.state; never rejects by itself.
+class SessionMiddleware:
+    def __init__(self, app):
+        self.app = app
 
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            user, error = None, None
+            for name, value in scope.get("headers", ()):
+                if name == b"authorization":
+                    user, error = _claims_from_header(value.decode("latin-1"))
+                    break
+            state = scope.setdefault("state", {})
+            state["user"] = user
+            state["auth_error"] = error
+        await self.app(scope, receive, send)
 
-class LoginModel(BaseModel):
-    email: str
-    password: str
+
+def _claims_from_header(authorization: str):
+    if not authorization.lower().startswith("bearer "):
+        return None, "Missing bearer token"
+    try:
+        return verify_session_token(authorization.split(" ", 1)[1].strip()), None
+    except SessionError as e:
+        return None, str(e)
+
+
+def current_user(request: Request) -> Dict[str, Any]:
+    """Dependency: the verified token claims, or 401."""
+    user = getattr(request.state, "user", None)
+    if user is None:
+        raise HTTPException(status_code=401,
+                            detail=getattr(request.state, "auth_error", None) or "Missing bearer token")
+    return user
 
 
 # ------------------ SIGNUP ROUTE ---------------------
 
 @router.post("/signup")
 async def signup(data: SignupModel):
-    users = db.users
+    # Hash password (bounded bcrypt pool; no connection is held meanwhile)
+    hashed_pw = await hash_password(data.password)
 
-    # Check if email exists
-    existing = await users.find_one({"email": data.email})
-    if existing:
+    # Single insert; the store rejects a taken email atomically
+    try:
+        user_id = await get_user_store().create_user(data.fullName, data.email, hashed_pw)
+    except UserExistsError:
         raise HTTPException(status_code=400, detail="Email already registered")
-
-    # Hash password
-    hashed_pw = hash_password(data.password)
-
-    # Insert user
-    user_doc = {
-        "username": data.username,
-        "email": data.email,
-        "password": hashed_pw,
-    }
-
-    result = await users.insert_one(user_doc)
+    except DatabaseError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
     return {
         "status": "success",
         "message": "User registered successfully",
-        "user_id": str(result.inserted_id)
+        "user_id": user_id
     }
 
 
@@ -54,24 +85,45 @@ async def signup(data: SignupModel):
 
 @router.post("/login")
 async def login(data: LoginModel):
-    users = db.users
+    try:
+        user = await get_user_store().get_credentials(data.email)
+    except DatabaseError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
-    # Find user by email
-    user = await users.find_one({"email": data.email})
     if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
     # Verify password
-    if not verify_password(data.password, user["password"]):
+    if not await verify_password(data.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
-    # Create JWT token
-    token = create_jwt(str(user["_id"]))
+    # Everything authenticated routes need goes in the token
+    token = create_session_token(user["id"], {"fullName": user["fullName"], "email": user["email"]})
 
     return {
         "status": "success",
         "message": "Login successful",
+        "user_id": user["id"],
+        "fullName": user["fullName"],
         "token": token,
-        "user_id": str(user["_id"]),
-        "username": user["username"]
+        "expires_in": SESSION_TTL_SECONDS
     }
+
+
+# ------------------ SESSION ROUTES ---------------------
+
+@router.get("/session")
+def session(user: Dict[str, Any] = Depends(current_user)):
+    """Check a session token from /login without re-sending credentials."""
+    return {
+        "status": "success",
+        "user_id": user["sub"],
+        "fullName": user.get("fullName"),
+        "expires_at": user["exp"]
+    }
+
+
+@router.get("/me")
+def me(user: Dict[str, Any] = Depends(current_user)):
+    # Served from the token; a renamed user sees the change after the next login.
+    return {"id": user["sub"], "fullName": user.get("fullName"), "email": user.get("email")}
@@ -0,0 +1,159 @@
+# backend/services/context_builder.py
+"""Pack retrieved chunks into the LLM prompt under a token budget.
+
+Tokens are counted with tiktoken (cl100k_base, close to the Llama 3 / GPT
+vocabularies) when it is installed, otherwise with a conservative regex
+estimate. Chunks are taken whole, best score first; a chunk that does not
+fit is skipped so smaller lower-ranked ones can still fill the remainder.
+If no chunk fits at all (chunks uploaded with a large chunk_size), the
+top-ranked one is cut down to the budget instead of leaving no context.
+
+The word chunker overlaps neighbouring chunks (default 50 words). When a
+chunk's doc_id / chunk_offset show it overlaps chunks already packed, only
+its uncovered words are kept, and it is dropped if less than
+CONTEXT_MIN_NOVEL_FRACTION of it is new. Every chunk (what is left of
+it) is then also checked by word-shingle containment against all packed
+text, which catches the same passage in two documents and chunks without
+offsets (older ingestions).
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+CONTEXT_MIN_NOVEL_FRACTION = float(os.getenv("CONTEXT_MIN_NOVEL_FRACTION", "0.3"))
+CONTEXT_SEPARATOR = "\n\n"
+_SHINGLE = 5
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # ~4 characters per BPE token for longer words; rounds up so the budget is not overrun.
+    return sum(1 + (len(tok) - 1) // 4 for tok in _TOKEN_RE.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest word-boundary prefix of `text` that fits in `max_tokens`."""
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid])) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo])
+
+
+def tokenizer_name() -> str:
+    return "tiktoken:cl100k_base" if _encoding is not None else "heuristic"
+
+
+def _shingles(words: List[str]) -> set:
+    if len(words) < _SHINGLE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + _SHINGLE]) for i in range(len(words) - _SHINGLE + 1)}
+
+
+def _uncovered(start: int, length: int, spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Parts of [start, start + length) not covered by `spans` (relative to start)."""
+    parts = [(start, start + length)]
+    for s, e in spans:
+        nxt = []
+        for a, b in parts:
+            if e <= a or s >= b:
+                nxt.append((a, b))
+                continue
+            if a < s:
+                nxt.append((a, s))
+            if e < b:
+                nxt.append((e, b))
+        parts = nxt
+    return [(a - start, b - start) for a, b in parts]
+
+
+def pack_context(matches, token_budget: Optional[int] = None,
+                 min_novel_fraction: Optional[float] = None) -> Tuple[str, Dict[str, Any]]:
+    """Context string for `matches` (objects with .score / .metadata) plus packing stats."""
+    budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    min_novel = CONTEXT_MIN_NOVEL_FRACTION if min_novel_fraction is None else min_novel_fraction
+    sep_tokens = count_tokens(CONTEXT_SEPARATOR)
+
+    ranked = sorted(matches, key=lambda m: m.score if m.score is not None else 0.0, reverse=True)
+    spans: Dict[str, List[Tuple[int, int]]] = {}   # doc_id -> packed word intervals
+    seen_shingles: set = set()
+    parts: List[str] = []
+    used = 0
+    duplicates = 0
+    trimmed = 0
+    over_budget = 0
+    truncated = 0
+    first_over: Optional[str] = None
+
+    for m in ranked:
+        meta = m.metadata or {}
+        text = meta.get("text") or ""
+        words = text.split()
+        if not words:
+            continue
+        doc_id, offset = meta.get("doc_id"), meta.get("chunk_offset")
+        pieces = [(0, len(words))]
+        if doc_id is not None and isinstance(offset, int):
+            pieces = _uncovered(offset, len(words), spans.get(doc_id, []))
+            if sum(b - a for a, b in pieces) < min_novel * len(words):
+                duplicates += 1
+                continue
+        # Identical text can also come from another document (or a chunk without offsets).
+        shingles = set().union(*(_shingles(words[a:b]) for a, b in pieces))
+        if shingles and len(shingles & seen_shingles) > (1 - min_novel) * len(shingles):
+            duplicates += 1
+            continue
+        if pieces != [(0, len(words))]:
+            trimmed += 1
+            text = " … ".join(" ".join(words[a:b]) for a, b in pieces)
+
+        cost = count_tokens(text) + (sep_tokens if parts else 0)
+        if used + cost > budget:
+            over_budget += 1
+            if first_over is None:
+                first_over = text
+            continue
+        parts.append(text)
+        used += cost
+        if doc_id is not None and isinstance(offset, int):
+            spans.setdefault(doc_id, []).append((offset, offset + len(words)))
+        seen_shingles |= _shingles(words)
+
+    if not parts and first_over is not None:
+        # Nothing fits whole: a cut-down best chunk beats an empty context.
+        text = truncate_to_tokens(first_over, budget)
+        if text:
+            parts.append(text)
+            used = count_tokens(text)
+            over_budget -= 1
+            truncated = 1
+
+    stats = {
+        "tokenizer": tokenizer_name(),
+        "token_budget": budget,
+        "tokens_used": used,
+        "chunks_packed": len(parts),
+        "chunks_trimmed": trimmed,
+        "chunks_duplicate": duplicates,
+        "chunks_over_budget": over_budget,
+        "chunks_truncated": truncated,
+    }
+    return CONTEXT_SEPARATOR.join(parts), stats
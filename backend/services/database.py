@@ -1,14 +1,265 @@
-import mysql.connector
+# backend/services/database.py
+"""Pooled database access for the users table.
+
+Each request checks a connection out with `db_cursor()` and returns it when
+the block exits, so concurrent threads never share a connection or cursor.
+Checked-out connections are pinged first and reconnected if the server
+dropped them. At most MYSQL_POOL_SIZE connections exist; extra callers wait
+up to MYSQL_POOL_TIMEOUT seconds for one to come back.
+
+DB_BACKEND=sqlite swaps MySQL for a local SQLite file (SQLITE_PATH) behind
+the same interface, for development and tests without a MySQL server.
+Queries use MySQL's %s placeholders either way.
+"""
 import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
-db = mysql.connector.connect(
-    host=os.getenv("MYSQL_HOST", "localhost"),
-    user=os.getenv("MYSQL_USER", "root"),
-    password=os.getenv("MYSQL_PASSWORD", ""),
-    database=os.getenv("MYSQL_DB", "smartcampus")
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").strip().lower()
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "8"))
+MYSQL_POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", "10"))
+SQLITE_PATH = os.getenv("SQLITE_PATH") or os.path.join(os.path.dirname(__file__), "data", "smartcampus.db")
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fullName TEXT NOT NULL,
+    email TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL
 )
+"""
+
+
+class DatabaseError(Exception):
+    pass
+
+
+class DuplicateKeyError(DatabaseError):
+    """An INSERT hit a UNIQUE index (e.g. users.email)."""
+
+
+class _SQLiteCursor:
+    """DB-API cursor wrapper taking MySQL-style %s placeholders and returning dict rows."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._cur = conn.cursor()
+
+    def execute(self, sql: str, params=()):
+        self._cur.execute(sql.replace("%s", "?"), params)
+        return self
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        return dict(row) if row is not None else None
+
+    def fetchall(self):
+        return [dict(row) for row in self._cur.fetchall()]
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def close(self):
+        self._cur.close()
+
+
+class _Pool:
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle = []
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.reconnects = 0
+        self.waits = 0
+
+    def _connect(self):
+        raise NotImplementedError
+
+    def _healthy(self, conn) -> bool:
+        raise NotImplementedError
+
+    def cursor(self, conn):
+        raise NotImplementedError
+
+    def is_duplicate(self, exc: Exception) -> bool:
+        raise NotImplementedError
+
+    def acquire(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.waits += 1
+            if not self._slots.acquire(timeout=MYSQL_POOL_TIMEOUT):
+                raise DatabaseError(f"No database connection free after {MYSQL_POOL_TIMEOUT}s "
+                                    f"(pool size {self.size})")
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+                self.checkouts += 1
+            if conn is not None and not self._healthy(conn):
+                with self._lock:
+                    self.reconnects += 1
+                self._close(conn)
+                conn = None
+            return conn if conn is not None else self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        try:
+            with self._lock:
+                self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": DB_BACKEND,
+                "pool_size": self.size,
+                "idle": len(self._idle),
+                "checkouts": self.checkouts,
+                "reconnects": self.reconnects,
+                "waits": self.waits,
+            }
+
+
+class MySQLPool(_Pool):
+    def __init__(self, size: int):
+        super().__init__(size)
+        import mysql.connector
+        self._mysql = mysql.connector
+        self._config = dict(
+            host=os.getenv("MYSQL_HOST", "localhost"),
+            port=int(os.getenv("MYSQL_PORT", "3306")),
+            user=os.getenv("MYSQL_USER", "root"),
+            password=os.getenv("MYSQL_PASSWORD", ""),
+            database=os.getenv("MYSQL_DB", "smartcampus"),
+            autocommit=False,
+        )
+
+    def _connect(self):
+        try:
+            return self._mysql.connect(**self._config)
+        except self._mysql.Error as e:
+            raise DatabaseError(f"MySQL connection failed: {e}") from e
+
+    def _healthy(self, conn) -> bool:
+        try:
+            # Reconnects in place if the server closed the connection (wait_timeout, restart).
+            conn.ping(reconnect=True, attempts=2, delay=0)
+            return True
+        except self._mysql.Error:
+            return False
+
+    def cursor(self, conn):
+        return conn.cursor(dictionary=True)
+
+    def is_duplicate(self, exc):
+        return isinstance(exc, self._mysql.IntegrityError) and getattr(exc, "errno", None) == 1062  # ER_DUP_ENTRY
+
+
+class SQLitePool(_Pool):
+    def __init__(self, size: int, path: str):
+        super().__init__(size)
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        conn.execute(_SQLITE_SCHEMA)
+        conn.commit()
+        self._idle.append(conn)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=MYSQL_POOL_TIMEOUT, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _healthy(self, conn) -> bool:
+        try:
+            conn.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def cursor(self, conn):
+        return _SQLiteCursor(conn)
+
+    def is_duplicate(self, exc):
+        return isinstance(exc, sqlite3.IntegrityError) and "UNIQUE" in str(exc)
+
+
+_pool: Optional[_Pool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> _Pool:
+    """Created on first use, so the API starts even while the database is down."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if DB_BACKEND == "sqlite":
+                    _pool = SQLitePool(MYSQL_POOL_SIZE, SQLITE_PATH)
+                elif DB_BACKEND == "mysql":
+                    _pool = MySQLPool(MYSQL_POOL_SIZE)
+                else:
+                    raise ValueError(f"Unknown DB_BACKEND '{DB_BACKEND}' (expected mysql or sqlite)")
+                print(f"[INFO] Database pool ready ({DB_BACKEND}, {_pool.size} connections max)")
+    return _pool
+
+
+@contextmanager
+def get_connection() -> Iterator:
+    # A connection that died mid-request goes back too; the next checkout's ping replaces it.
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+@contextmanager
+def db_cursor(commit: bool = False) -> Iterator:
+    """Dict-row cursor on a pooled connection; commits on success when `commit`, else rolls back."""
+    pool = get_pool()
+    with get_connection() as conn:
+        cur = pool.cursor(conn)
+        try:
+            yield cur
+            if commit:
+                conn.commit()
+            else:
+                conn.rollback()
+        except Exception as e:
+            conn.rollback()
+            if pool.is_duplicate(e):
+                raise DuplicateKeyError(str(e)) from e
+            raise
+        finally:
+            cur.close()
+
 
-cursor = db.cursor(dictionary=True)
+def get_pool_stats(create: bool = True) -> Optional[Dict[str, Any]]:
+    """Pool counters; with create=False, None while no pool exists (callers that must not open one)."""
+    if not create and _pool is None:
+        return None
+    return get_pool().stats()
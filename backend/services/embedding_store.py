@@ -0,0 +1,172 @@
+# backend/services/embedding_store.py
+"""Append-only binary store for cached embeddings.
+
+Layout (two files next to each other):
+  <name>.bin  records of [sha256 digest (32 bytes) | dim (uint32) | dim x float32]
+  <name>.idx  records of [sha256 digest (32 bytes) | payload offset (uint64) | dim (uint32)]
+
+Only the small index is loaded at open; vectors are read with a single seek
+per key. New entries are appended to both files, existing bytes are never
+rewritten. If the index lags behind the data file (crash between the two
+writes) the missing entries are recovered by scanning the data tail.
+"""
+import os
+import json
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_DATA_HEADER = struct.Struct("<32sI")
+_INDEX_RECORD = struct.Struct("<32sQI")
+
+
+class EmbeddingStore:
+    def __init__(self, base_path: Path):
+        base_path = Path(base_path)
+        self.data_path = base_path.with_suffix(".bin")
+        self.index_path = base_path.with_suffix(".idx")
+        self._index: Dict[bytes, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        self.data_path.parent.mkdir(parents=True, exist_ok=True)
+        self.data_path.touch(exist_ok=True)
+        self.index_path.touch(exist_ok=True)
+
+        # Load index records; ignore a torn trailing record.
+        raw = self.index_path.read_bytes()
+        usable = len(raw) - (len(raw) % _INDEX_RECORD.size)
+        data_size = self.data_path.stat().st_size
+        data_end = 0
+        valid_index_bytes = 0
+        for pos in range(0, usable, _INDEX_RECORD.size):
+            digest, offset, dim = _INDEX_RECORD.unpack_from(raw, pos)
+            end = offset + dim * 4
+            if end > data_size:
+                break
+            self._index[digest] = (offset, dim)
+            data_end = max(data_end, end)
+            valid_index_bytes = pos + _INDEX_RECORD.size
+        if valid_index_bytes != len(raw):
+            with open(self.index_path, "r+b") as f:
+                f.truncate(valid_index_bytes)
+
+        recovered = self._recover_tail(data_end, data_size)
+        if recovered:
+            print(f"[INFO] Recovered {recovered} embedding cache entries from data file")
+
+        self._data_reader = open(self.data_path, "rb")
+        self._data_writer = open(self.data_path, "ab")
+        self._index_writer = open(self.index_path, "ab")
+
+    def _recover_tail(self, start: int, data_size: int) -> int:
+        """Index complete records written after the last indexed one, drop a torn tail."""
+        if start >= data_size:
+            return 0
+        recovered = []
+        pos = start
+        with open(self.data_path, "rb") as f:
+            f.seek(start)
+            while pos + _DATA_HEADER.size <= data_size:
+                digest, dim = _DATA_HEADER.unpack(f.read(_DATA_HEADER.size))
+                payload = pos + _DATA_HEADER.size
+                if payload + dim * 4 > data_size:
+                    break
+                recovered.append((digest, payload, dim))
+                f.seek(dim * 4, os.SEEK_CUR)
+                pos = payload + dim * 4
+        if pos < data_size:
+            with open(self.data_path, "r+b") as f:
+                f.truncate(pos)
+        if recovered:
+            with open(self.index_path, "ab") as f:
+                for digest, offset, dim in recovered:
+                    f.write(_INDEX_RECORD.pack(digest, offset, dim))
+                    self._index[digest] = (offset, dim)
+        return len(recovered)
+
+    @staticmethod
+    def _digest(key: str) -> bytes:
+        return bytes.fromhex(key)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: str) -> bool:
+        return self._digest(key) in self._index
+
+    def _read(self, offset: int, dim: int) -> np.ndarray:
+        self._data_reader.seek(offset)
+        buf = self._data_reader.read(dim * 4)
+        return np.frombuffer(buf, dtype="<f4")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        entry = self._index.get(self._digest(key))
+        if entry is None:
+            return None
+        with self._lock:
+            return self._read(*entry)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._index.get(self._digest(key))
+                if entry is not None:
+                    found[key] = self._read(*entry)
+        return found
+
+    def put(self, key: str, vector) -> None:
+        self.put_many([(key, vector)])
+
+    def put_many(self, items: Iterable[Tuple[str, object]]) -> int:
+        written = 0
+        with self._lock:
+            self._data_writer.seek(0, os.SEEK_END)
+            pos = self._data_writer.tell()
+            index_records: List[bytes] = []
+            for key, vector in items:
+                digest = self._digest(key)
+                if digest in self._index:
+                    continue
+                arr = np.asarray(vector, dtype="<f4").ravel()
+                self._data_writer.write(_DATA_HEADER.pack(digest, arr.size))
+                self._data_writer.write(arr.tobytes())
+                payload = pos + _DATA_HEADER.size
+                self._index[digest] = (payload, arr.size)
+                index_records.append(_INDEX_RECORD.pack(digest, payload, arr.size))
+                pos = payload + arr.nbytes
+                written += 1
+            if written:
+                # Data must hit the file before the index points at it.
+                self._data_writer.flush()
+                self._index_writer.write(b"".join(index_records))
+                self._index_writer.flush()
+        return written
+
+    def import_json(self, json_path: Path) -> int:
+        """One-time import of the legacy whole-file JSON cache."""
+        json_path = Path(json_path)
+        if not json_path.exists():
+            return 0
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except Exception as e:
+            print(f"[WARN] Failed to import legacy cache: {e}")
+            return 0
+        imported = self.put_many(legacy.items())
+        print(f"[INFO] Imported {imported} embeddings from {json_path.name}")
+        return imported
+
+    def close(self):
+        with self._lock:
+            for f in (self._data_reader, self._data_writer, self._index_writer):
+                try:
+                    f.close()
+                except Exception:
+                    pass
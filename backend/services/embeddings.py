@@ -1,90 +1,348 @@
 # backend/services/embeddings.py
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from collections import OrderedDict
 import os
 import hashlib
-import json
+import threading
+import asyncio
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
+from services.embedding_store import EmbeddingStore
+from services.executor import run_io
+from services.metrics import EMBED_SECONDS, EMBED_TEXTS, batch_size_label
 load_dotenv()
 
 HF_EMBEDDING_MODEL = os.getenv("HF_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+EMBEDDING_LRU_MAX_BYTES = int(os.getenv("EMBEDDING_LRU_MAX_BYTES", str(32 * 1024 * 1024)))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
 CACHE_FILE = Path(__file__).parent / ".embeddings_cache.json"
+CACHE_STORE_PATH = Path(os.getenv("EMBEDDING_CACHE_PATH", str(Path(__file__).parent / ".embeddings_cache")))
 
 _model = None
+_model_lock = threading.Lock()
+_store = None
+_store_lock = threading.Lock()
+_encode_pool: Optional[ThreadPoolExecutor] = None
 
 def _get_model():
     global _model
     if _model is None:
-        from sentence_transformers import SentenceTransformer
-        print(f"[INFO] Loading embedding model: {HF_EMBEDDING_MODEL}")
-        _model = SentenceTransformer(HF_EMBEDDING_MODEL)
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                print(f"[INFO] Loading embedding model: {HF_EMBEDDING_MODEL}")
+                _model = SentenceTransformer(HF_EMBEDDING_MODEL)
     return _model
 
-def _load_cache():
-    if CACHE_FILE.exists():
-        try:
-            with open(CACHE_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"[WARN] Failed to load cache: {e}")
-    return {}
-
-def _save_cache(cache):
-    try:
-        with open(CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump(cache, f)
-    except Exception as e:
-        print(f"[WARN] Failed to save cache: {e}")
+def _get_store() -> EmbeddingStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = EmbeddingStore(CACHE_STORE_PATH)
+                if len(store) == 0:
+                    store.import_json(CACHE_FILE)
+                _store = store
+    return _store
 
 def _hash_text(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
+
+class LRUEmbeddingCache:
+    """In-memory LRU of float32 vectors keyed by raw text, bounded by bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entry_size(text: str, vec: np.ndarray) -> int:
+        return vec.nbytes + len(text)
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vec = self._entries.get(text)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(text)
+            self.hits += 1
+            return vec
+
+    def put(self, text: str, vec) -> None:
+        vec = np.asarray(vec, dtype=np.float32)
+        size = self._entry_size(text, vec)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(text, None)
+            if old is not None:
+                self.current_bytes -= self._entry_size(text, old)
+            self._entries[text] = vec
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                old_text, old_vec = self._entries.popitem(last=False)
+                self.current_bytes -= self._entry_size(old_text, old_vec)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+_lru = LRUEmbeddingCache(EMBEDDING_LRU_MAX_BYTES)
+
+def get_cache_stats() -> Dict[str, Any]:
+    return {"memory": _lru.stats(), "disk_entries": len(_store) if _store is not None else None}
+
+def _lookup_stored(texts: List[str]) -> Dict[int, np.ndarray]:
+    """Resolve texts from the persistent store only; hits are promoted to the LRU tier."""
+    keys = {}
+    for i, t in enumerate(texts):
+        keys.setdefault(_hash_text(t), []).append(i)
+    found = {}
+    for key, vec in _get_store().get_many(keys.keys()).items():
+        for i in keys[key]:
+            found[i] = vec
+        _lru.put(texts[keys[key][0]], vec)
+    return found
+
+def _lookup_cached(texts: List[str]) -> Dict[int, np.ndarray]:
+    """Resolve texts from the LRU tier first, then the persistent store."""
+    found = {}
+    missing = []
+    for i, t in enumerate(texts):
+        vec = _lru.get(t)
+        if vec is not None:
+            found[i] = vec
+        else:
+            missing.append(i)
+    if missing:
+        for j, vec in _lookup_stored([texts[i] for i in missing]).items():
+            found[missing[j]] = vec
+    return found
+
+def _remember(texts: List[str], vecs) -> None:
+    _get_store().put_many((_hash_text(t), v) for t, v in zip(texts, vecs))
+    for t, v in zip(texts, vecs):
+        _lru.put(t, v)
+
 def get_embedding(text: str, use_cache: bool = True) -> List[float]:
     if not text or not text.strip():
         raise ValueError("Cannot generate embedding for empty text")
-    model = _get_model()
-    cache = _load_cache() if use_cache else {}
-    key = _hash_text(text)
-    if use_cache and key in cache:
-        return cache[key]
-    vec = model.encode(text).tolist()
     if use_cache:
-        cache[key] = vec
-        _save_cache(cache)
-    return vec
+        cached = _lookup_cached([text])
+        if cached:
+            return cached[0].tolist()
+    with EMBED_SECONDS.time(batch_size="1"):
+        vec = _get_model().encode(text)
+    EMBED_TEXTS.inc(path="single")
+    if use_cache:
+        _remember([text], [vec])
+    return vec.tolist()
 
 def get_embeddings_batch(texts: List[str], use_cache: bool = True) -> List[List[float]]:
     if not texts:
         return []
-    model = _get_model()
-    cache = _load_cache() if use_cache else {}
+    for i, t in enumerate(texts):
+        if not t or not t.strip():
+            raise ValueError(f"Text at index {i} is empty")
     results = [None] * len(texts)
+    cached = _lookup_cached(texts) if use_cache else {}
     uncached_texts = []
     uncached_indices = []
     for i, t in enumerate(texts):
-        if not t or not t.strip():
-            raise ValueError(f"Text at index {i} is empty")
-        key = _hash_text(t)
-        if use_cache and key in cache:
-            results[i] = cache[key]
+        if i in cached:
+            results[i] = cached[i].tolist()
         else:
             uncached_texts.append(t)
             uncached_indices.append(i)
+    if uncached_texts:
+        model = _get_model()
     for start in range(0, len(uncached_texts), EMBEDDING_BATCH_SIZE):
         end = start + EMBEDDING_BATCH_SIZE
         batch = uncached_texts[start:end]
-        vecs = model.encode(batch)
+        with EMBED_SECONDS.time(batch_size=batch_size_label(len(batch))):
+            vecs = model.encode(batch)
+        EMBED_TEXTS.inc(len(batch), path="batch")
         for j, vec in enumerate(vecs):
-            idx = uncached_indices[start + j]
-            arr = vec.tolist()
-            results[idx] = arr
-            if use_cache:
-                cache[_hash_text(batch[j])] = arr
-    if use_cache:
-        _save_cache(cache)
+            results[uncached_indices[start + j]] = vec.tolist()
+        if use_cache:
+            _remember(batch, vecs)
     return results
 
+def _encode_texts(texts: List[str]) -> np.ndarray:
+    return np.asarray(_get_model().encode(texts), dtype=np.float32)
+
+def _get_encode_pool() -> ThreadPoolExecutor:
+    global _encode_pool
+    if _encode_pool is None:
+        with _model_lock:
+            if _encode_pool is None:
+                _encode_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="encode")
+    return _encode_pool
+
+async def _aencode(texts: List[str]) -> np.ndarray:
+    # One model in this process, encoding on a dedicated thread: torch releases the GIL
+    # and uses its own intra-op threads, so worker processes would only add model copies.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_encode_pool(), _encode_texts, texts)
+
+def shutdown_encode_pool():
+    global _encode_pool
+    with _model_lock:
+        if _encode_pool is not None:
+            _encode_pool.shutdown(wait=False, cancel_futures=True)
+            _encode_pool = None
+
+
+class EmbeddingBatcher:
+    """Gathers concurrent single-text requests into one encode call.
+
+    A batch is flushed when it reaches max_batch_size or max_wait_ms after its
+    first item arrived. Encoding runs in the CPU pool; requests that arrive
+    while a batch is encoding form the next one.
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.batches = 0
+        self.texts = 0
+        self._loop = None
+        self._queue = None
+        self._worker = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def embed(self, text: str, use_cache: bool = True) -> List[float]:
+        if not text or not text.strip():
+            raise ValueError("Cannot generate embedding for empty text")
+        if use_cache:
+            vec = _lru.get(text)  # memory tier: no thread hop on a hit
+            if vec is not None:
+                return vec.tolist()
+            cached = await run_io(_lookup_stored, [text])  # disk tier reads off the event loop
+            if cached:
+                return cached[0].tolist()
+        self._ensure_worker()
+        fut = self._loop.create_future()
+        self._queue.put_nowait((text, use_cache, fut))
+        return await fut
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                with EMBED_SECONDS.time(batch_size=batch_size_label(len(texts))):
+                    vecs = await _aencode(texts)
+            except Exception as e:
+                for _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            EMBED_TEXTS.inc(len(texts), path="query")
+            by_text = dict(zip(texts, vecs))
+            cacheable = list(dict.fromkeys(t for t, use_cache, _ in batch if use_cache))
+            if cacheable:
+                try:
+                    await run_io(_remember, cacheable, [by_text[t] for t in cacheable])
+                except Exception as e:
+                    print(f"[WARN] Failed to cache batched embeddings: {e}")
+            for text, _, fut in batch:
+                if not fut.done():
+                    fut.set_result(by_text[text].tolist())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": (self.texts / self.batches) if self.batches else 0.0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+_batcher = EmbeddingBatcher(EMBEDDING_MAX_BATCH, EMBEDDING_MAX_WAIT_MS)
+
+async def embed_query(text: str, use_cache: bool = True) -> List[float]:
+    """Async single-text embedding through the shared micro-batcher."""
+    return await _batcher.embed(text, use_cache=use_cache)
+
+async def aget_embeddings_batch(texts: List[str], use_cache: bool = True) -> List[List[float]]:
+    """Async counterpart of get_embeddings_batch: cache I/O in threads, encoding on the encode thread."""
+    if not texts:
+        return []
+    for i, t in enumerate(texts):
+        if not t or not t.strip():
+            raise ValueError(f"Text at index {i} is empty")
+    results = [None] * len(texts)
+    cached = await run_io(_lookup_cached, texts) if use_cache else {}
+    for i, vec in cached.items():
+        results[i] = vec.tolist()
+    uncached_indices = [i for i in range(len(texts)) if i not in cached]
+    for start in range(0, len(uncached_indices), EMBEDDING_BATCH_SIZE):
+        idxs = uncached_indices[start:start + EMBEDDING_BATCH_SIZE]
+        batch = [texts[i] for i in idxs]
+        with EMBED_SECONDS.time(batch_size=batch_size_label(len(batch))):
+            vecs = await _aencode(batch)
+        EMBED_TEXTS.inc(len(batch), path="batch")
+        for i, vec in zip(idxs, vecs):
+            results[i] = vec.tolist()
+        if use_cache:
+            await run_io(_remember, batch, vecs)
+    return results
+
+def get_batcher_stats() -> Dict[str, Any]:
+    return _batcher.stats()
+
 def get_embeddings_for_chunks(chunks: List[str], use_cache: bool = True, batch: bool = True) -> List[List[float]]:
     if not chunks:
         raise ValueError("No chunks provided")
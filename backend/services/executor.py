@@ -0,0 +1,105 @@
+# backend/services/executor.py
+"""Shared worker pools so async handlers never run blocking work on the event loop.
+
+- run_io:  threads, for network/disk calls (Chroma, Groq, cache files)
+- run_cpu: processes, for CPU-bound work that holds the GIL (PyMuPDF extraction)
+
+Embedding encode does not use run_cpu: it runs on a dedicated thread in this
+process (see embeddings.py), so the model is loaded only once.
+
+Set CPU_POOL_WORKERS=0 to keep CPU-bound work in the thread pool instead.
+"""
+import os
+import asyncio
+import threading
+import multiprocessing
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+IO_POOL_WORKERS = int(os.getenv("IO_POOL_WORKERS", "16"))
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def get_io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    if _io_pool is None:
+        with _lock:
+            if _io_pool is None:
+                _io_pool = ThreadPoolExecutor(max_workers=max(1, IO_POOL_WORKERS), thread_name_prefix="io")
+    return _io_pool
+
+
+def get_cpu_pool() -> Optional[ProcessPoolExecutor]:
+    global _cpu_pool
+    if CPU_POOL_WORKERS <= 0:
+        return None
+    if _cpu_pool is None:
+        with _lock:
+            if _cpu_pool is None:
+                # spawn: forking a process that already holds torch/fitz state is not safe
+                ctx = multiprocessing.get_context("spawn")
+                _cpu_pool = ProcessPoolExecutor(max_workers=CPU_POOL_WORKERS, mp_context=ctx)
+                print(f"[INFO] Started CPU process pool ({CPU_POOL_WORKERS} workers)")
+    return _cpu_pool
+
+
+async def run_io(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_pool(), partial(fn, *args, **kwargs))
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Run a picklable top-level function in the process pool."""
+    global _cpu_pool
+    pool = get_cpu_pool()
+    if pool is None:
+        return await run_io(fn, *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, partial(fn, *args, **kwargs))
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM on a huge PDF); drop the pool so the next call starts fresh.
+        with _lock:
+            if _cpu_pool is pool:
+                _cpu_pool = None
+        raise
+
+
+class LoopSemaphore:
+    """Concurrency limit for module-level use: `async with LIMIT.get():`.
+
+    An asyncio.Semaphore belongs to the loop it is first used on, so a new
+    one is made whenever the running loop changes (tests, worker restarts).
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+
+    def get(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._semaphore
+
+
+def shutdown_pools(wait: bool = True):
+    global _io_pool, _cpu_pool
+    with _lock:
+        if _cpu_pool is not None:
+            _cpu_pool.shutdown(wait=wait, cancel_futures=True)
+            _cpu_pool = None
+        if _io_pool is not None:
+            _io_pool.shutdown(wait=wait, cancel_futures=True)
+            _io_pool = None
@@ -0,0 +1,395 @@
+# backend/services/ingest.py
+"""PDF ingestion pipeline (extract -> chunk -> embed -> store) and background jobs.
+
+`ingest_pdf` is awaited directly by /upload, or wrapped in a job by
+`submit_ingest_job` so the request can return immediately and clients poll
+`get_job`. Jobs run as tasks on the event loop; at most INGEST_MAX_CONCURRENT
+run at once, and their CPU-heavy stages go through the shared process pool.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import uuid
+import tempfile
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+from dotenv import load_dotenv
+
+from services.pdf_reader import count_pages, extract_pages, WordChunker, PDF_PARALLEL_MIN_PAGES
+from services.embeddings import aget_embeddings_batch, EMBEDDING_BATCH_SIZE
+from services.vector_store import (
+    store_embeddings, get_document_chunks, get_document_vectors, update_metadata, delete_embeddings,
+    get_document, register_document, find_document_by_hash,
+)
+from services.executor import run_cpu, run_io, get_cpu_pool, LoopSemaphore, CPU_POOL_WORKERS
+from services.metrics import PDF_EXTRACT_SECONDS, CHUNK_SECONDS
+
+load_dotenv()
+
+INGEST_MAX_CONCURRENT = int(os.getenv("INGEST_MAX_CONCURRENT", str(max(1, CPU_POOL_WORKERS))))
+INGEST_MAX_JOBS_KEPT = int(os.getenv("INGEST_MAX_JOBS_KEPT", "200"))
+INGEST_PAGE_WINDOW = int(os.getenv("INGEST_PAGE_WINDOW", "16"))
+INGEST_PARALLEL_WINDOWS = int(os.getenv("INGEST_PARALLEL_WINDOWS", str(max(1, CPU_POOL_WORKERS))))
+
+
+class IngestError(Exception):
+    pass
+
+
+class IngestJob:
+    def __init__(self, filename: str, doc_id: Optional[str] = None, tags: Optional[Dict[str, str]] = None):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.doc_id = doc_id or make_doc_id(filename, tags)
+        self.tags = tags or {}
+        self.stage = "queued"
+        self.pages_total = None
+        self.pages_processed = 0
+        self.chunks_total = None
+        self.chunks_processed = 0
+        self.text_length = None
+        self.vectors_stored = 0
+        self.dedup = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+
+    def update(self, **fields):
+        for k, v in fields.items():
+            setattr(self, k, v)
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = (end - self.started_at) if self.started_at else 0.0
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "doc_id": self.doc_id,
+            "stage": self.stage,
+            "pages_total": self.pages_total,
+            "pages_processed": self.pages_processed,
+            "chunks_total": self.chunks_total,
+            "chunks_processed": self.chunks_processed,
+            "text_length": self.text_length,
+            "vectors_stored": self.vectors_stored,
+            "elapsed_seconds": round(elapsed, 3),
+            "chunks_per_second": round(self.chunks_processed / elapsed, 2) if elapsed > 0 else 0.0,
+            "dedup": self.dedup,
+            "error": self.error,
+        }
+
+
+def fingerprint(*parts: bytes) -> str:
+    """sha256 of the parts in sequence, without joining them into one copy."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part)
+    return h.hexdigest()
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", text).strip("-.").lower()
+
+
+def make_doc_id(filename: str, tags: Optional[Dict[str, str]] = None) -> str:
+    """Default doc_id: the filename slug under its owner and course, e.g. `owner-u1/course-c1/syllabus`.
+
+    The same filename in another course or for another owner is a different
+    document, so its upload never re-ingests over this one.
+    """
+    tags = tags or {}
+    scope = [f"{field[:-3]}-{_slug(str(tags[field]))}" for field in ("owner_id", "course_id") if tags.get(field)]
+    stem = os.path.splitext(os.path.basename(filename or ""))[0]
+    return "/".join(scope + [_slug(stem) or "document"])
+
+
+def chunk_id(doc_id: str, chunk_hash: str) -> str:
+    return f"{doc_id}:{chunk_hash[:32]}"
+
+
+def _spool_pdf(pdf_bytes: bytes) -> str:
+    with tempfile.NamedTemporaryFile(prefix="ingest-", suffix=".pdf", delete=False) as f:
+        f.write(pdf_bytes)
+        return f.name
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError as e:
+        print(f"[WARN] Could not remove {path}: {e}")
+
+
+async def ingest_pdf(pdf_bytes: bytes, chunk_size: int = 512, overlap: int = 50,
+                     progress: Optional[Callable[..., None]] = None, filename: str = "",
+                     doc_id: Optional[str] = None, tags: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Stream the PDF through the pipeline a page window at a time.
+
+    Chunks get stable ids `<doc_id>:<sha256 of chunk text>` plus doc_id, page and
+    word-offset metadata. Re-ingesting a document diffs its new chunk ids
+    against the stored ones: only new chunks are embedded and inserted, chunks
+    that vanished are deleted, and unchanged chunks that merely moved get a
+    metadata update. If the PDF bytes (and chunking settings) match the last
+    ingestion of the same doc_id, extraction is skipped entirely. If they match
+    another document (the same file uploaded under a different name), that
+    document's stored vectors are copied under this doc_id, so nothing is
+    extracted or encoded twice and each document keeps its own chunks.
+
+    `tags` (course_id / owner_id) are stored on every chunk so searches can be
+    scoped with metadata filters. Without an explicit doc_id it is derived from
+    the filename and tags (see make_doc_id); a doc_id whose stored chunks carry
+    other tags is refused with IngestError rather than overwritten.
+
+    Pages are extracted INGEST_PAGE_WINDOW at a time in the CPU pool, with up to
+    INGEST_PARALLEL_WINDOWS windows in flight (serially on a thread below
+    PDF_PARALLEL_MIN_PAGES pages), fed in page order to an
+    incremental chunker (overlap carries across pages) and flushed to the
+    embedder/store every EMBEDDING_BATCH_SIZE chunks, so only a few windows
+    of text and one batch of chunks are held in memory.
+    """
+    report = progress or (lambda **_: None)
+    chunker = WordChunker(chunk_size, overlap)
+    tags = {k: v for k, v in (tags or {}).items() if v is not None}
+    doc_id = doc_id or make_doc_id(filename, tags)
+
+    # Chunking settings are part of the key: the same PDF chunked differently is new work.
+    settings = json.dumps({"chunk_size": chunk_size, "overlap": overlap, "tags": tags}, sort_keys=True)
+    doc_hash = fingerprint(pdf_bytes, settings.encode())
+    # Also opens the store (and its document registry) off the event loop.
+    stored = await run_io(get_document_chunks, doc_id)
+    scope = (tags.get("course_id"), tags.get("owner_id"))
+    if any((meta.get("course_id"), meta.get("owner_id")) != scope for meta in stored.values()):
+        # Re-ingesting would delete or re-tag chunks another course / owner searches.
+        raise IngestError(f"Document '{doc_id}' is stored under a different course_id / owner_id; "
+                          f"upload it with its own doc_id")
+
+    known = get_document(doc_id)
+    if known is not None and known["doc_hash"] == doc_hash:
+        report(stage="done", pages_total=known["page_count"], pages_processed=known["page_count"],
+               chunks_total=known["chunks_created"], chunks_processed=known["chunks_created"])
+        return {
+            "doc_id": doc_id,
+            "text_length": known["text_length"],
+            "chunks_created": known["chunks_created"],
+            "vectors_stored": 0,
+            "dedup": {
+                "doc_hash": doc_hash,
+                "document_known": True,
+                "extraction_skipped": True,
+                "pages_skipped": known["page_count"],
+                "chunks_skipped": known["chunks_created"],
+                "chunks_new": 0,
+                "chunks_copied": 0,
+                "chunks_moved": 0,
+                "chunks_deleted": 0,
+                "duplicate_of": None,
+            },
+        }
+
+    original = find_document_by_hash(doc_hash)
+    if original is not None and original != doc_id:
+        # Same content already indexed under another name: copy its vectors under this
+        # doc_id (no extraction or encoding), so each document owns its chunks.
+        info = get_document(original)
+        report(stage="storing")
+        src_ids, embeddings, src_metas = await run_io(get_document_vectors, original)
+        doc_meta = {**tags, "doc_id": doc_id, "filename": filename}
+        ids = [chunk_id(doc_id, meta["chunk_hash"]) for meta in src_metas]
+        metas = [{**meta, **doc_meta} for meta in src_metas]
+        texts = [meta.pop("text", "") for meta in metas]
+        keep = set(ids)
+        stale = [cid for cid in stored if cid not in keep]
+        deleted = await run_io(delete_embeddings, stale) if stale else 0
+        copied = await run_io(store_embeddings, embeddings, texts, ids=ids, metadatas=metas) if ids else 0
+        register_document(doc_id, {**info, "filename": filename})
+        report(stage="done", pages_total=info["page_count"], pages_processed=info["page_count"],
+               chunks_total=info["chunks_created"], chunks_processed=info["chunks_created"], vectors_stored=copied)
+        return {
+            "doc_id": doc_id,
+            "text_length": info["text_length"],
+            "chunks_created": info["chunks_created"],
+            "vectors_stored": copied,
+            "dedup": {
+                "doc_hash": doc_hash,
+                "document_known": known is not None,
+                "extraction_skipped": True,
+                "pages_skipped": info["page_count"],
+                "chunks_skipped": info["chunks_created"],
+                "chunks_new": 0,
+                "chunks_copied": copied,
+                "chunks_moved": 0,
+                "chunks_deleted": deleted,
+                "duplicate_of": original,
+            },
+        }
+
+    report(stage="extracting")
+    page_count = await run_io(count_pages, pdf_bytes)
+    # Below PDF_PARALLEL_MIN_PAGES pages are extracted serially on a thread from the
+    # bytes: a temp file plus process-pool hops would cost more than the extraction.
+    # Larger files go to worker processes as a temp-file path: one disk write instead
+    # of pickling the whole file into a process for every page window.
+    parallel = get_cpu_pool() is not None and page_count >= PDF_PARALLEL_MIN_PAGES
+    source = await run_io(_spool_pdf, pdf_bytes) if parallel else pdf_bytes
+    try:
+        report(pages_total=page_count)
+        doc_meta = {**tags, "doc_id": doc_id, "filename": filename}
+
+        pending = []
+        seen = set()
+        created = 0
+        processed = 0
+        skipped = 0
+        moved = 0
+        saved = 0
+        text_length = 0
+        non_empty_pages = 0
+
+        async def extract_window(start, stop):
+            with PDF_EXTRACT_SECONDS.time():
+                return await (run_cpu if parallel else run_io)(extract_pages, source, start, stop)
+
+        async def flush(batch):
+            nonlocal processed, skipped, moved, saved
+            new_ids, new_chunks, new_metas = [], [], []
+            moved_ids, moved_metas = [], []
+            for chunk, offset, page in batch:
+                chunk_hash = fingerprint(chunk.encode("utf-8"))
+                cid = chunk_id(doc_id, chunk_hash)
+                if cid in seen:
+                    continue
+                seen.add(cid)
+                meta = {**doc_meta, "chunk_hash": chunk_hash, "page": page, "chunk_offset": offset}
+                old = stored.get(cid)
+                if old is None:
+                    new_ids.append(cid)
+                    new_chunks.append(chunk)
+                    new_metas.append(meta)
+                elif {k: v for k, v in old.items() if k != "text"} != meta:
+                    moved_ids.append(cid)
+                    moved_metas.append({**meta, "text": chunk})
+            if new_chunks:
+                report(stage="embedding")
+                embeddings = await aget_embeddings_batch(new_chunks, use_cache=True)
+                report(stage="storing")
+                saved += await run_io(store_embeddings, embeddings, new_chunks, ids=new_ids, metadatas=new_metas)
+            if moved_ids:
+                moved += await run_io(update_metadata, moved_ids, moved_metas)
+            processed += len(batch)
+            skipped += len(batch) - len(new_chunks)
+            report(chunks_processed=processed, vectors_stored=saved)
+
+        window = max(1, INGEST_PAGE_WINDOW)
+        windows = [(start, min(start + window, page_count)) for start in range(0, page_count, window)]
+        group_size = max(1, INGEST_PARALLEL_WINDOWS) if parallel else 1
+        for g in range(0, len(windows), group_size):
+            group = windows[g:g + group_size]
+            report(stage="extracting")
+            parts = await asyncio.gather(*(extract_window(start, stop) for start, stop in group))
+            for (start, _), part in zip(group, parts):
+                for i, page_text in enumerate(part):
+                    if not page_text:
+                        continue
+                    text_length += len(page_text)
+                    non_empty_pages += 1
+                    with CHUNK_SECONDS.time():
+                        spans = chunker.feed_spans(page_text, page=start + i + 1)
+                    pending.extend(spans)
+                    created += len(spans)
+            report(pages_processed=group[-1][1])
+            while len(pending) >= EMBEDDING_BATCH_SIZE:
+                await flush(pending[:EMBEDDING_BATCH_SIZE])
+                del pending[:EMBEDDING_BATCH_SIZE]
+
+        with CHUNK_SECONDS.time():
+            tail = chunker.finish_spans()
+        pending.extend(tail)
+        created += len(tail)
+        report(chunks_total=created)
+        if created == 0:
+            raise IngestError("No text extracted from PDF")
+        while pending:
+            await flush(pending[:EMBEDDING_BATCH_SIZE])
+            del pending[:EMBEDDING_BATCH_SIZE]
+
+        # Chunks of the previous version that no longer occur.
+        stale = [cid for cid in stored if cid not in seen]
+        deleted = await run_io(delete_embeddings, stale) if stale else 0
+
+        # Same length as the page texts joined with newlines.
+        text_length += max(0, non_empty_pages - 1)
+        register_document(doc_id, {
+            "doc_hash": doc_hash,
+            "filename": filename,
+            "page_count": page_count,
+            "text_length": text_length,
+            "chunks_created": created,
+        })
+        return {
+            "doc_id": doc_id,
+            "text_length": text_length,
+            "chunks_created": created,
+            "vectors_stored": saved,
+            "dedup": {
+                "doc_hash": doc_hash,
+                "document_known": bool(stored),
+                "extraction_skipped": False,
+                "pages_skipped": 0,
+                "chunks_skipped": skipped,
+                "chunks_new": saved,
+                "chunks_copied": 0,
+                "chunks_moved": moved,
+                "chunks_deleted": deleted,
+                "duplicate_of": None,
+            },
+        }
+    finally:
+        if source is not pdf_bytes:
+            _remove_quietly(source)
+
+
+_jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+_jobs_lock = threading.Lock()
+_job_limit = LoopSemaphore(INGEST_MAX_CONCURRENT)
+
+
+async def _run_job(job: IngestJob, pdf_bytes: bytes, chunk_size: int, overlap: int):
+    async with _job_limit.get():
+        job.update(stage="starting", started_at=time.time())
+        try:
+            result = await ingest_pdf(pdf_bytes, chunk_size=chunk_size, overlap=overlap,
+                                      progress=job.update, filename=job.filename, doc_id=job.doc_id, tags=job.tags)
+            job.update(stage="done", text_length=result["text_length"], dedup=result["dedup"])
+        except Exception as e:
+            print(f"[WARN] Ingestion job {job.id} failed: {e}")
+            job.update(stage="failed", error=str(e))
+        finally:
+            job.update(finished_at=time.time())
+
+
+def submit_ingest_job(pdf_bytes: bytes, filename: str, chunk_size: int = 512, overlap: int = 50,
+                      doc_id: Optional[str] = None, tags: Optional[Dict[str, str]] = None) -> IngestJob:
+    """Queue a background ingestion on the running event loop and return its job."""
+    job = IngestJob(filename, doc_id, tags)
+    with _jobs_lock:
+        _jobs[job.id] = job
+        # Forget the oldest finished jobs once the table is full.
+        for old_id in list(_jobs):
+            if len(_jobs) <= INGEST_MAX_JOBS_KEPT:
+                break
+            if _jobs[old_id].finished_at is not None:
+                del _jobs[old_id]
+    # Keep a reference on the job so the task is not garbage-collected mid-run.
+    job.task = asyncio.get_running_loop().create_task(_run_job(job, pdf_bytes, chunk_size, overlap))
+    return job
+
+
+def get_job(job_id: str) -> Optional[IngestJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
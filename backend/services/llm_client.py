@@ -0,0 +1,231 @@
+# backend/services/llm_client.py
+"""Process-wide async client for the Groq (OpenAI-compatible) chat API.
+
+One httpx.AsyncClient per event loop keeps TLS connections alive across
+answers instead of building a client per call. At most LLM_MAX_CONCURRENT
+requests are in flight; 429 / 5xx responses and transport errors are retried
+up to LLM_MAX_RETRIES times with full-jitter exponential backoff (honouring
+Retry-After). Point GROQ_BASE_URL at scripts/mock_llm_server.py to run
+without the real API.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional
+import httpx
+from dotenv import load_dotenv
+
+from services.metrics import LLM_SECONDS, LLM_RETRIES
+
+load_dotenv()
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1").rstrip("/")
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "8"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMClient:
+    def __init__(self, base_url: str = GROQ_BASE_URL, api_key: Optional[str] = GROQ_API_KEY,
+                 model: str = GROQ_MODEL, max_concurrent: int = LLM_MAX_CONCURRENT,
+                 max_retries: int = LLM_MAX_RETRIES):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_retries = max(0, max_retries)
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _ensure(self):
+        # httpx clients and semaphores are bound to the loop that first uses them.
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                self._close_stale(self._client, self._loop)
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+                timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                    max_keepalive_connections=LLM_MAX_CONNECTIONS),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._loop = loop
+        return self._client, self._semaphore
+
+    @staticmethod
+    def _close_stale(client: httpx.AsyncClient, loop):
+        """Close a client left behind by another event loop instead of leaking its connections."""
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(_aclose_quietly(client), loop)
+        else:
+            # Its loop is gone; close what can be closed from here.
+            asyncio.get_running_loop().create_task(_aclose_quietly(client))
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(float(retry_after), LLM_RETRY_MAX_SECONDS)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * (2 ** attempt)))
+
+    def _body(self, messages: List[Dict[str, str]], max_tokens: int, stream: bool, **params) -> Dict[str, Any]:
+        return {"model": self.model, "messages": messages, "max_tokens": max_tokens, "stream": stream, **params}
+
+    def _count(self, started: float, retries: int, failed: bool, mode: str = "chat"):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.requests += 1
+            self.retries += retries
+            self.failures += int(failed)
+            self.total_seconds += elapsed
+        LLM_SECONDS.observe(elapsed, mode=mode, outcome="error" if failed else "ok")
+        if retries:
+            LLM_RETRIES.inc(retries, mode=mode)
+
+    async def chat(self, messages: List[Dict[str, str]], max_tokens: int = 512, **params) -> str:
+        """Completion text for `messages`; retried on 429 / 5xx / connection errors."""
+        client, semaphore = self._ensure()
+        body = self._body(messages, max_tokens, False, **params)
+        started = time.perf_counter()
+        attempt = 0
+        async with semaphore:
+            while True:
+                response = None
+                try:
+                    response = await client.post("/chat/completions", json=body)
+                except httpx.TransportError as e:
+                    error = e
+                else:
+                    if response.status_code not in RETRY_STATUS:
+                        try:
+                            response.raise_for_status()
+                            content = response.json()["choices"][0]["message"]["content"]
+                        except (httpx.HTTPStatusError, KeyError, IndexError, ValueError) as e:
+                            self._count(started, attempt, True)
+                            raise LLMError(f"LLM request failed: {e}") from e
+                        self._count(started, attempt, False)
+                        return content
+                    error = LLMError(f"LLM returned HTTP {response.status_code}")
+                if attempt >= self.max_retries:
+                    self._count(started, attempt, True)
+                    raise LLMError(f"LLM request failed after {attempt + 1} attempts: {error}")
+                await asyncio.sleep(self._backoff(attempt, response))
+                attempt += 1
+
+    async def stream_chat(self, messages: List[Dict[str, str]], max_tokens: int = 512,
+                          **params) -> AsyncIterator[str]:
+        """Yield content deltas. Retries happen only before the first delta is sent."""
+        client, semaphore = self._ensure()
+        body = self._body(messages, max_tokens, True, **params)
+        started = time.perf_counter()
+        attempt = 0
+        async with semaphore:
+            while True:
+                response = None
+                sent = False
+                try:
+                    async with client.stream("POST", "/chat/completions", json=body) as response:
+                        if response.status_code not in RETRY_STATUS:
+                            if response.is_error:
+                                await response.aread()
+                                self._count(started, attempt, True, mode="stream")
+                                raise LLMError(f"LLM request failed: HTTP {response.status_code} {response.text[:200]}")
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[len("data:"):].strip()
+                                if data == "[DONE]":
+                                    break
+                                try:
+                                    choices = json.loads(data).get("choices") or [{}]
+                                except (ValueError, AttributeError) as e:
+                                    self._count(started, attempt, True, mode="stream")
+                                    raise LLMError(f"LLM stream sent malformed data: {data[:200]!r}") from e
+                                delta = (choices[0].get("delta") or {}).get("content")
+                                if delta:
+                                    sent = True
+                                    yield delta
+                            self._count(started, attempt, False, mode="stream")
+                            return
+                    error = LLMError(f"LLM returned HTTP {response.status_code}")
+                except httpx.TransportError as e:
+                    if sent:
+                        # Part of the answer already reached the caller; a retry would repeat it.
+                        self._count(started, attempt, True, mode="stream")
+                        raise LLMError(f"LLM stream interrupted: {e}") from e
+                    error = e
+                if attempt >= self.max_retries:
+                    self._count(started, attempt, True, mode="stream")
+                    raise LLMError(f"LLM request failed after {attempt + 1} attempts: {error}")
+                await asyncio.sleep(self._backoff(attempt, response))
+                attempt += 1
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "base_url": self.base_url,
+                "model": self.model,
+                "max_concurrent": self.max_concurrent,
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "avg_seconds": (self.total_seconds / self.requests) if self.requests else 0.0,
+            }
+
+
+async def _aclose_quietly(client: httpx.AsyncClient):
+    try:
+        await client.aclose()
+    except Exception as e:
+        print(f"[WARN] Closing stale LLM client failed: {e}")
+
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not GROQ_API_KEY:
+                    print("[WARN] GROQ_API_KEY not set — generation will fail until set in .env")
+                _client = LLMClient()
+    return _client
+
+
+async def close_llm_client():
+    if _client is not None:
+        await _client.aclose()
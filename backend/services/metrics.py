@@ -0,0 +1,281 @@
+# backend/services/metrics.py
+"""In-process metrics in the Prometheus text format, served at GET /metrics.
+
+Pipeline stages record into the histograms below from the main process
+(work sent to the CPU process pool is timed around the run_cpu call, since
+a worker's own counters would never reach the scrape). Cache hit ratios and
+vector counts are read from the existing stats functions at scrape time, so
+they cost nothing between scrapes.
+
+With METRICS_ENABLED=false every hook returns immediately and /metrics
+answers 404.
+"""
+import os
+import time
+import threading
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").strip().lower() not in ("0", "false", "no", "off")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        # Samples and the HELP / TYPE lines share one name, so it carries the suffix.
+        super().__init__(name if name.endswith("_total") else name + "_total", help_text, labelnames)
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_label_str(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_label_str(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # per-bucket (non-cumulative) counts, then sum; cumulated when rendered
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def time(self, **labels) -> "_Timer":
+        """`with HIST.time(stage="x"):` observes the block's wall time."""
+        return _Timer(self, labels) if METRICS_ENABLED else _NULL_TIMER
+
+    def _samples(self):
+        with self._lock:
+            items = [(k, list(counts), total) for k, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                le = 'le="%s"' % _fmt(bound)
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, le)} {running}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {running}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("_hist", "_labels", "_start")
+
+    def __init__(self, hist: Histogram, labels: Dict[str, Any]):
+        self._hist = hist
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._hist.observe(time.perf_counter() - self._start, **self._labels)
+        return False
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def batch_size_label(n: int) -> str:
+    """Power-of-two bucket for a batch size ("1", "2", "4", ... "256+"), keeping label cardinality small."""
+    if n >= 256:
+        return "256+"
+    size = 1
+    while size < n:
+        size *= 2
+    return str(size)
+
+
+# ------------------ PIPELINE METRICS ---------------------
+
+PDF_EXTRACT_SECONDS = Histogram("pdf_extract_seconds", "PDF text extraction time per call (page window or whole file)")
+CHUNK_SECONDS = Histogram("chunking_seconds", "Time spent splitting extracted page text into chunks")
+EMBED_SECONDS = Histogram("embedding_encode_seconds", "Model encode time per batch", ("batch_size",))
+EMBED_TEXTS = Counter("embedding_texts_encoded_total", "Texts encoded by the embedding model", ("path",))
+VECTOR_SECONDS = Histogram("vector_store_seconds", "Vector store operation latency", ("op",))
+LLM_SECONDS = Histogram("llm_request_seconds", "LLM call latency including retries", ("mode", "outcome"),
+                        buckets=LLM_BUCKETS)
+LLM_RETRIES = Counter("llm_retries_total", "LLM attempts beyond the first", ("mode",))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+HTTP_SECONDS = Histogram("http_request_seconds", "HTTP request latency (streams: until the last byte)",
+                         ("method", "route", "status"))
+
+
+# In-flight gauge and per-route latency for every HTTP request.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            # Route template, not the raw path, so ids do not explode label cardinality.
+            HTTP_SECONDS.observe(time.perf_counter() - start, method=scope.get("method", ""),
+                                 route=getattr(route, "path", "unmatched"), status=status["code"])
+
+
+# ------------------ SCRAPE-TIME GAUGES ---------------------
+
+def _collected() -> List[Tuple[str, str, List[Tuple[Dict[str, str], float]]]]:
+    """(name, help, [(labels, value)]) read from the services' own stats at scrape time."""
+    from services.answer_cache import get_answer_cache_stats
+    from services.embeddings import get_cache_stats
+    from services.quiz import get_quiz_stats
+    from services.vector_store import get_store_info, vector_count
+    from services.database import get_pool_stats
+
+    out = []
+    ratios = []
+    answer = get_answer_cache_stats()
+    ratios.append(({"cache": "answer_exact"}, answer["exact"]["hit_rate"]))
+    ratios.append(({"cache": "answer_semantic"}, answer["semantic"]["hit_rate"]))
+    ratios.append(({"cache": "embedding_memory"}, get_cache_stats()["memory"]["hit_rate"]))
+    quiz = get_quiz_stats()["cache"]
+    ratios.append(({"cache": "quiz"}, quiz["hit_rate"]))
+    out.append(("cache_hit_ratio", "Hits / lookups since start, per cache", ratios))
+
+    info = get_store_info()
+    if info["loaded"]:
+        # Only once loaded: a scrape must not trigger opening the store.
+        out.append(("vector_store_vectors", "Vectors in the index", [({"backend": info["backend"]}, vector_count())]))
+        out.append(("vector_store_documents", "Registered documents", [({}, info["documents"])]))
+        out.append(("corpus_version", "Index change counter", [({}, info["corpus_version"])]))
+
+    stats = get_pool_stats(create=False)
+    if stats is not None:
+        out.append(("db_pool_idle_connections", "Idle pooled database connections", [({}, stats["idle"])]))
+    return out
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    try:
+        collected = _collected()
+    except Exception as e:
+        print(f"[WARN] Metrics collection failed: {e}")
+        collected = []
+    for name, help_text, samples in collected:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            names = tuple(labels)
+            lines.append(f"{name}{_label_str(names, tuple(labels[n] for n in names))} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
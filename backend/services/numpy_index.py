@@ -0,0 +1,529 @@
+# backend/services/numpy_index.py
+"""In-process vector index on a contiguous float32 matrix (VECTOR_BACKEND=numpy).
+
+Vectors are L2-normalized on insert, so cosine similarity is one matmul.
+Small collections use exact flat search (matmul + argpartition). Once the
+live count reaches IVF_MIN_VECTORS, an IVF index (spherical k-means
+partitions) is trained lazily and queries only score the rows in the
+IVF_NPROBE closest partitions.
+
+Rows are also indexed by FILTER_FIELDS (course / document / owner) in
+posting lists, so a filtered search gathers just that subset's rows and
+its cost scales with the subset, not the collection.
+
+With a persist dir the index lives in:
+  <name>.<gen>.f32  raw float32 rows, appended, read back via np.memmap
+                    (generation 0 is plain <name>.f32)
+  <name>.log.jsonl  append-only log of add / del / meta operations
+  <name>.ivf.npz    trained centroids and row -> partition assignments
+Deletes are tombstones; the files are compacted once tombstones exceed
+COMPACT_RATIO of the rows. Compaction writes the live rows to the next
+generation's vectors file and then replaces the log, whose first record
+names that generation, so the single os.replace switches both at once and
+files of any other generation are leftovers removed on load.
+"""
+import os
+import re
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.vector_store import VectorBackend, FILTER_FIELDS
+
+IVF_MIN_VECTORS = int(os.getenv("IVF_MIN_VECTORS", "20000"))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 = sqrt(live vectors)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+IVF_TRAIN_ITERS = int(os.getenv("IVF_TRAIN_ITERS", "10"))
+COMPACT_RATIO = 0.25
+COMPACT_MIN_ROWS = 1000
+_ASSIGN_BLOCK = 65536
+_SCORE_BLOCK_ELEMENTS = 1 << 24
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    mat = np.asarray(mat, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def _score(cos: float) -> float:
+    # Same scale as the Chroma backend: 1 / (1 + squared L2) on unit vectors.
+    return 1.0 / (3.0 - 2.0 * float(cos))
+
+
+def spherical_kmeans(data: np.ndarray, k: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    """k-means on unit vectors using cosine similarity; returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty partitions with random points.
+            sums[empty] = data[rng.choice(len(data), size=int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class NumpyVectorIndex(VectorBackend):
+    name = "numpy"
+
+    def __init__(self, name: str, dim: int, persist_dir: str = ""):
+        self.dim = dim
+        self.nprobe = IVF_NPROBE
+        self._lock = threading.RLock()
+        self._reset_state()
+        self._name = name
+        self._gen = 0
+        self._dir = self._vec_path = self._log_path = self._ivf_path = None
+        if persist_dir:
+            base = Path(persist_dir)
+            base.mkdir(parents=True, exist_ok=True)
+            self._dir = base
+            self._vec_path = self._vec_file(0)
+            self._log_path = base / f"{name}.log.jsonl"
+            self._ivf_path = base / f"{name}.ivf.npz"
+            self._load()
+
+    # ------------------------------------------------------------------ state
+
+    def _reset_state(self):
+        self._ids: List[Optional[str]] = []
+        self._metas: List[Optional[Dict[str, Any]]] = []
+        self._rows: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._buffer = np.zeros((0, self.dim), dtype=np.float32)
+        self._mmap = None
+        self._n = 0
+        self._deleted = 0
+        # (field, value) -> rows carrying it; dead rows are filtered with _alive
+        self._postings: Dict[Tuple[str, Any], set] = {}
+        self._posting_arrays: Dict[Tuple[str, Any], np.ndarray] = {}
+        self._reset_ivf()
+
+    def _reset_ivf(self):
+        self._centroids = None
+        self._row_list = np.zeros(0, dtype=np.int32)
+        self._lists = None
+        self._trained_on = 0
+
+    @property
+    def persistent(self) -> bool:
+        return self._vec_path is not None
+
+    def _matrix(self) -> np.ndarray:
+        if self.persistent:
+            return self._mmap if self._mmap is not None else np.zeros((0, self.dim), dtype=np.float32)
+        return self._buffer[:self._n]
+
+    def _remap(self):
+        self._mmap = None
+        if self._n:
+            self._mmap = np.memmap(self._vec_path, dtype=np.float32, mode="r", shape=(self._n, self.dim))
+
+    def _grow(self, extra: int):
+        needed = self._n + extra
+        if len(self._alive) < needed:
+            alive = np.zeros(max(needed, 2 * len(self._alive), 1024), dtype=bool)
+            alive[:self._n] = self._alive[:self._n]
+            self._alive = alive
+        if not self.persistent and len(self._buffer) < needed:
+            buf = np.zeros((max(needed, 2 * len(self._buffer), 1024), self.dim), dtype=np.float32)
+            buf[:self._n] = self._buffer[:self._n]
+            self._buffer = buf
+
+    def _set_meta(self, row: int, meta: Optional[Dict[str, Any]]):
+        """Set a row's metadata and move it between FILTER_FIELDS postings."""
+        old = self._metas[row] or {}
+        new = meta or {}
+        for field in FILTER_FIELDS:
+            if field in old and (field not in new or new[field] != old[field]):
+                key = (field, old[field])
+                self._postings[key].discard(row)
+                self._posting_arrays.pop(key, None)
+            if field in new and (field not in old or new[field] != old[field]):
+                key = (field, new[field])
+                self._postings.setdefault(key, set()).add(row)
+                self._posting_arrays.pop(key, None)
+        self._metas[row] = meta
+
+    def _posting(self, key: Tuple[str, Any]) -> np.ndarray:
+        arr = self._posting_arrays.get(key)
+        if arr is None:
+            arr = np.array(sorted(self._postings.get(key, ())), dtype=np.int64)
+            self._posting_arrays[key] = arr
+        return arr
+
+    def _filter_rows(self, where: Dict[str, Any]) -> np.ndarray:
+        """Sorted live rows matching every {field: value} in `where`."""
+        rows = None
+        for field, value in where.items():
+            if field in FILTER_FIELDS:
+                posting = self._posting((field, value))
+                rows = posting if rows is None else np.intersect1d(rows, posting, assume_unique=True)
+        if rows is None:
+            rows = np.arange(self._n)
+        rows = rows[self._alive[rows]]
+        unindexed = [(k, v) for k, v in where.items() if k not in FILTER_FIELDS]
+        if unindexed:
+            keep = [row for row in rows if all(self._metas[row].get(k) == v for k, v in unindexed)]
+            rows = np.asarray(keep, dtype=np.int64)
+        return rows
+
+    # ------------------------------------------------------------ persistence
+
+    def _log(self, records: List[Dict[str, Any]]):
+        if not self.persistent or not records:
+            return
+        with open(self._log_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in records))
+
+    def _vec_file(self, gen: int) -> Path:
+        return self._dir / (f"{self._name}.f32" if gen == 0 else f"{self._name}.{gen}.f32")
+
+    def _read_generation(self) -> int:
+        """Generation named by the log's first record (logs from before compaction had none: 0)."""
+        if not self._log_path.exists():
+            return 0
+        with open(self._log_path, "rb") as f:
+            first = f.readline()
+        try:
+            rec = json.loads(first)
+        except ValueError:
+            return 0
+        return int(rec["gen"]) if isinstance(rec, dict) and rec.get("op") == "gen" else 0
+
+    def _remove_stale_vectors(self):
+        pattern = re.compile(re.escape(self._name) + r"(\.\d+)?\.f32(\.tmp)?")
+        for path in self._dir.iterdir():
+            if path != self._vec_path and pattern.fullmatch(path.name):
+                print(f"[WARN] Removing {path.name} left by an interrupted compaction")
+                path.unlink()
+
+    def _load(self):
+        self._gen = self._read_generation()
+        self._vec_path = self._vec_file(self._gen)
+        self._remove_stale_vectors()
+        row_bytes = self.dim * 4
+        file_rows = self._vec_path.stat().st_size // row_bytes if self._vec_path.exists() else 0
+        adds = 0
+        log_size = self._log_path.stat().st_size if self._log_path.exists() else 0
+        valid_log_bytes = 0
+        if log_size:
+            with open(self._log_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn last line
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break
+                    op = rec.get("op")
+                    if op == "add":
+                        row = rec["row"]
+                        if row >= file_rows:
+                            break  # vectors never reached disk
+                        self._grow(row + 1 - self._n)
+                        while self._n <= row:
+                            self._ids.append(None)
+                            self._metas.append(None)
+                            self._n += 1
+                        self._tombstone(rec["id"])
+                        self._ids[row] = rec["id"]
+                        self._set_meta(row, rec["meta"])
+                        self._rows[rec["id"]] = row
+                        self._alive[row] = True
+                        adds += 1
+                    elif op == "del":
+                        self._tombstone(rec["id"])
+                    elif op == "meta" and rec["id"] in self._rows:
+                        self._set_meta(self._rows[rec["id"]], rec["meta"])
+                    valid_log_bytes += len(line)
+        if valid_log_bytes != log_size:
+            # Drop everything after the first bad record so later appends are replayed on the
+            # next start and new adds cannot reuse rows that stale records still point at.
+            print(f"[WARN] Truncating {self._log_path.name} after {valid_log_bytes} of {log_size} bytes")
+            with open(self._log_path, "r+b") as f:
+                f.truncate(valid_log_bytes)
+        # Rows past the last logged add are orphans from an interrupted write.
+        self._deleted = self._n - len(self._rows)
+        if file_rows > self._n:
+            with open(self._vec_path, "r+b") as f:
+                f.truncate(self._n * row_bytes)
+        self._remap()
+        self._load_ivf()
+        if adds:
+            print(f"[INFO] Loaded {len(self._rows)} vectors from {self._vec_path.name}")
+
+    def _load_ivf(self):
+        if self._ivf_path is None or not self._ivf_path.exists():
+            return
+        try:
+            data = np.load(self._ivf_path)
+            centroids, row_list = data["centroids"], data["row_list"]
+        except Exception as e:
+            print(f"[WARN] Failed to load IVF index: {e}")
+            return
+        gen = int(data["gen"]) if "gen" in data else 0
+        if centroids.shape[1] != self.dim or len(row_list) > self._n or gen != self._gen:
+            return
+        self._centroids = centroids
+        self._trained_on = int(data["trained_on"])
+        self._row_list = np.full(self._n, -1, dtype=np.int32)
+        self._row_list[:len(row_list)] = row_list
+        self._assign(len(row_list), self._n)
+
+    def _save_ivf(self):
+        if self._ivf_path is None or self._centroids is None:
+            return
+        tmp = self._ivf_path.with_name(self._ivf_path.name + ".tmp.npz")
+        np.savez(tmp, centroids=self._centroids, row_list=self._row_list[:self._n],
+                 trained_on=np.int64(self._trained_on), gen=np.int64(self._gen))
+        os.replace(tmp, self._ivf_path)
+
+    def _compact(self):
+        """Rewrite storage with live rows only (row numbers change)."""
+        live = [row for row in range(self._n) if self._ids[row] is not None and self._alive[row]]
+        vectors = np.array(self._matrix()[live], dtype=np.float32) if live else np.zeros((0, self.dim), np.float32)
+        ids = [self._ids[row] for row in live]
+        metas = [self._metas[row] for row in live]
+        if self.persistent:
+            self._mmap = None
+            gen = self._gen + 1
+            new_vec = self._vec_file(gen)
+            tmp_log = self._log_path.with_name(self._log_path.name + ".tmp")
+            vectors.tofile(new_vec)
+            with open(tmp_log, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"op": "gen", "gen": gen}) + "\n")
+                for row, (vid, meta) in enumerate(zip(ids, metas)):
+                    f.write(json.dumps({"op": "add", "id": vid, "row": row, "meta": meta}) + "\n")
+            # The commit point: until here a restart still loads the old generation intact.
+            os.replace(tmp_log, self._log_path)
+            old_vec, self._gen, self._vec_path = self._vec_path, gen, new_vec
+            if old_vec.exists():
+                old_vec.unlink()
+            if self._ivf_path.exists():
+                self._ivf_path.unlink()
+        self._reset_state()
+        self._grow(len(ids))
+        if not self.persistent:
+            self._buffer[:len(ids)] = vectors
+        self._ids = ids
+        self._metas = [None] * len(ids)
+        for row, meta in enumerate(metas):
+            self._set_meta(row, meta)
+        self._rows = {vid: row for row, vid in enumerate(ids)}
+        self._n = len(ids)
+        self._alive[:self._n] = True
+        if self.persistent:
+            self._remap()
+
+    def _tombstone(self, vid: str) -> bool:
+        row = self._rows.pop(vid, None)
+        if row is None:
+            return False
+        self._alive[row] = False
+        self._ids[row] = None
+        self._set_meta(row, None)
+        self._deleted += 1
+        return True
+
+    def _maybe_compact(self):
+        if self._n >= COMPACT_MIN_ROWS and self._deleted > COMPACT_RATIO * self._n:
+            self._compact()
+
+    # -------------------------------------------------------------------- IVF
+
+    def _assign(self, start: int, stop: int):
+        if self._centroids is None or start >= stop:
+            return
+        if len(self._row_list) < stop:
+            grown = np.full(max(stop, 2 * len(self._row_list)), -1, dtype=np.int32)
+            grown[:len(self._row_list)] = self._row_list
+            self._row_list = grown
+        matrix = self._matrix()
+        for block in range(start, stop, _ASSIGN_BLOCK):
+            end = min(block + _ASSIGN_BLOCK, stop)
+            self._row_list[block:end] = np.argmax(matrix[block:end] @ self._centroids.T, axis=1)
+        self._lists = None
+
+    def _train(self, live: int):
+        nlist = IVF_NLIST or int(np.sqrt(live))
+        nlist = max(1, min(nlist, live))
+        rows = np.flatnonzero(self._alive[:self._n])
+        sample_size = min(len(rows), max(nlist * 32, 10000))
+        rng = np.random.default_rng(0)
+        sample = np.asarray(self._matrix()[np.sort(rng.choice(rows, size=sample_size, replace=False))])
+        self._centroids = spherical_kmeans(sample, nlist, IVF_TRAIN_ITERS)
+        self._row_list = np.full(self._n, -1, dtype=np.int32)
+        self._trained_on = live
+        self._assign(0, self._n)
+        self._save_ivf()
+        print(f"[INFO] Trained IVF index: {nlist} partitions over {live} vectors")
+
+    def _ivf_candidates(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        live = self._n - self._deleted
+        if self._centroids is None or live >= 2 * self._trained_on:
+            self._train(live)
+        if self._lists is None:
+            assigned = self._row_list[:self._n]
+            order = np.argsort(assigned, kind="stable")
+            bounds = np.searchsorted(assigned[order], np.arange(len(self._centroids) + 1))
+            self._lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self._centroids))]
+        nprobe = max(1, min(nprobe, len(self._centroids)))
+        probe = np.argpartition(-(self._centroids @ q), nprobe - 1)[:nprobe]
+        rows = np.concatenate([self._lists[c] for c in probe])
+        return rows[self._alive[rows]]
+
+    # ---------------------------------------------------------- VectorBackend
+
+    def add(self, ids, embeddings, metadatas):
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), self.dim))
+        with self._lock:
+            for vid in ids:
+                self._tombstone(vid)  # upsert: a re-added id replaces its old row
+            start = self._n
+            self._grow(len(ids))
+            if self.persistent:
+                with open(self._vec_path, "ab") as f:
+                    f.write(vectors.tobytes())
+            else:
+                self._buffer[start:start + len(ids)] = vectors
+            records = []
+            for i, (vid, meta) in enumerate(zip(ids, metadatas)):
+                row = start + i
+                self._ids.append(vid)
+                self._metas.append(None)
+                self._set_meta(row, meta)
+                self._rows[vid] = row
+                self._alive[row] = True
+                records.append({"op": "add", "id": vid, "row": row, "meta": meta})
+            self._n += len(ids)
+            self._log(records)
+            if self.persistent:
+                self._remap()
+            self._assign(start, self._n)
+            self._maybe_compact()
+        return len(ids)
+
+    def _top_k(self, scores: np.ndarray, rows: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        k = min(top_k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {"id": self._ids[rows[i]], "score": _score(scores[i]), "metadata": self._metas[rows[i]]}
+            for i in top
+        ]
+
+    def _flat_batch(self, queries: np.ndarray, top_k: int, subset: Optional[np.ndarray]) -> List[List[Dict[str, Any]]]:
+        """Exact search over all rows, or only `subset`; blocked to ~64 MB of scores."""
+        if subset is None:
+            rows = np.arange(self._n)
+            matrix = self._matrix()
+            dead = ~self._alive[:self._n] if self._deleted else None
+        else:
+            rows = subset
+            matrix = np.asarray(self._matrix()[subset])
+            dead = None
+        results = []
+        block = max(1, _SCORE_BLOCK_ELEMENTS // max(1, len(rows)))
+        for start in range(0, len(queries), block):
+            scores = queries[start:start + block] @ matrix.T
+            if dead is not None:
+                scores[:, dead] = -np.inf
+            results.extend(self._top_k(row_scores, rows, top_k) for row_scores in scores)
+        return results
+
+    def query(self, query_vector, top_k, where=None, nprobe: Optional[int] = None):
+        return self.query_batch([query_vector], top_k, where=where, nprobe=nprobe)[0]
+
+    def query_batch(self, query_vectors, top_k, where=None, nprobe: Optional[int] = None):
+        queries = _normalize(np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), self.dim))
+        with self._lock:
+            live = self._n - self._deleted
+            if live == 0 or top_k <= 0:
+                return [[] for _ in query_vectors]
+            subset = self._filter_rows(where) if where else None
+            size = live if subset is None else len(subset)
+            if size == 0:
+                return [[] for _ in query_vectors]
+            if size < IVF_MIN_VECTORS:
+                return self._flat_batch(queries, top_k, subset)
+
+            results = []
+            matrix = self._matrix()
+            for q in queries:
+                rows = self._ivf_candidates(q, nprobe or self.nprobe)
+                if subset is not None:
+                    rows = rows[np.isin(rows, subset, assume_unique=True)]
+                if len(rows) < top_k:
+                    # Too few candidates in the probed partitions.
+                    results.extend(self._flat_batch(q[None, :], top_k, subset))
+                else:
+                    results.append(self._top_k(matrix[rows] @ q, rows, top_k))
+            return results
+
+    def get_metadata(self, where):
+        with self._lock:
+            return {self._ids[row]: self._metas[row] for row in self._filter_rows(where)}
+
+    def get_vectors(self, where):
+        with self._lock:
+            rows = self._filter_rows(where)
+            return ([self._ids[row] for row in rows], np.asarray(self._matrix()[rows]).tolist(),
+                    [self._metas[row] for row in rows])
+
+    def update_metadata(self, ids, metadatas):
+        with self._lock:
+            records = []
+            for vid, meta in zip(ids, metadatas):
+                row = self._rows.get(vid)
+                if row is None:
+                    continue
+                self._set_meta(row, meta)
+                records.append({"op": "meta", "id": vid, "meta": meta})
+            self._log(records)
+        return len(records)
+
+    def delete(self, ids):
+        with self._lock:
+            removed = [vid for vid in ids if self._tombstone(vid)]
+            self._log([{"op": "del", "id": vid} for vid in removed])
+            self._maybe_compact()
+        return len(removed)
+
+    def count(self):
+        with self._lock:
+            return self._n - self._deleted
+
+    def clear(self):
+        with self._lock:
+            count = self._n - self._deleted
+            self._reset_state()
+            if self.persistent:
+                for path in (self._vec_path, self._log_path, self._ivf_path):
+                    if path.exists():
+                        path.unlink()
+                self._gen = 0
+                self._vec_path = self._vec_file(0)
+        return count
+
+    def info(self):
+        with self._lock:
+            live = self._n - self._deleted
+            return {
+                "index": "ivf" if live >= IVF_MIN_VECTORS else "flat",
+                "nlist": len(self._centroids) if self._centroids is not None else None,
+                "nprobe": self.nprobe,
+                "rows": self._n,
+                "tombstones": self._deleted,
+            }
@@ -1,15 +1,107 @@
 # backend/services/pdf_reader.py
+import os
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 import fitz
 
+# Below this page count ingestion extracts serially instead of in worker processes
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+
+# PDF bytes, or the path of a PDF file (cheap to send to a worker process)
+PdfSource = Union[bytes, str]
+
+def _clean_page_text(page_text: str) -> str:
+    return "\n".join(line.strip() for line in page_text.splitlines() if line.strip())
+
+def _open(source: PdfSource):
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source, filetype="pdf")
+
+def count_pages(source: PdfSource) -> int:
+    with _open(source) as pdf:
+        return pdf.page_count
+
+def iter_pdf_pages(source: PdfSource, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    """Yield cleaned text for pages [start, stop), one page at a time."""
+    pdf = _open(source)
+    try:
+        stop = pdf.page_count if stop is None else min(stop, pdf.page_count)
+        for pno in range(start, stop):
+            yield _clean_page_text(pdf.load_page(pno).get_text("text"))
+    finally:
+        pdf.close()
+
+def extract_pages(source: PdfSource, start: int = 0, stop: Optional[int] = None) -> List[str]:
+    # Top-level so a page window can be extracted inside the CPU process pool;
+    # pass a path there so the PDF is not pickled into the worker for every window.
+    return list(iter_pdf_pages(source, start, stop))
+
 def extract_text_from_pdf(file_bytes: bytes) -> str:
-    text = ""
-    pdf = fitz.open(stream=file_bytes, filetype="pdf")
-    for page in pdf:
-        page_text = page.get_text("text")
-        text += page_text + "\n"
-    pdf.close()
-    cleaned_text = "\n".join([line.strip() for line in text.splitlines() if line.strip()])
-    return cleaned_text
+    return "\n".join(page for page in iter_pdf_pages(file_bytes) if page)
+
+class WordChunker:
+    """Incremental word-window chunker; overlap carries across fed texts (e.g. pages).
+
+    feed_spans/finish_spans also report where each chunk starts: its word
+    offset in the whole stream and the page it starts on.
+    """
+
+    def __init__(self, chunk_size: int = 512, overlap: int = 50):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be > 0")
+        if overlap < 0 or overlap >= chunk_size:
+            raise ValueError("0 <= overlap < chunk_size required")
+        self.chunk_size = chunk_size
+        self.step = max(1, chunk_size - overlap)
+        self._words: List[str] = []
+        self._offset = 0                            # stream offset of self._words[0]
+        self._page_starts: List[Tuple[int, Optional[int]]] = []  # (stream offset, page)
+
+    def _page_at(self, offset: int) -> Optional[int]:
+        page = None
+        for start, p in self._page_starts:
+            if start > offset:
+                break
+            page = p
+        return page
+
+    def _emit(self) -> Tuple[str, int, Optional[int]]:
+        span = (" ".join(self._words[:self.chunk_size]), self._offset, self._page_at(self._offset))
+        del self._words[:self.step]
+        self._offset += self.step
+        # Keep only the page boundary still covering the buffer start, plus later ones.
+        while len(self._page_starts) > 1 and self._page_starts[1][0] <= self._offset:
+            self._page_starts.pop(0)
+        return span
+
+    def feed_spans(self, text: str, page: Optional[int] = None) -> List[Tuple[str, int, Optional[int]]]:
+        words = text.split()
+        if words:
+            self._page_starts.append((self._offset + len(self._words), page))
+            self._words.extend(words)
+        spans = []
+        while len(self._words) >= self.chunk_size:
+            spans.append(self._emit())
+        return spans
+
+    def finish_spans(self) -> List[Tuple[str, int, Optional[int]]]:
+        # Same tail windows as the old whole-text loop: one per step until the words run out.
+        spans = []
+        while self._words:
+            spans.append(self._emit())
+        return spans
+
+    def feed(self, text: str, page: Optional[int] = None) -> List[str]:
+        return [chunk for chunk, _, _ in self.feed_spans(text, page)]
+
+    def finish(self) -> List[str]:
+        return [chunk for chunk, _, _ in self.finish_spans()]
+
+def iter_word_chunks(texts: Iterable[str], chunk_size: int = 512, overlap: int = 50) -> Iterator[str]:
+    chunker = WordChunker(chunk_size, overlap)
+    for text in texts:
+        yield from chunker.feed(text)
+    yield from chunker.finish()
 
 def chunk_text(text: str, chunk_size: int = 512, overlap: int = 50, method: str = "word"):
     if chunk_size <= 0:
@@ -27,20 +119,7 @@ def chunk_text(text: str, chunk_size: int = 512, overlap: int = 50, method: str
             chunks.append(text)
         return chunks
     elif method == "word":
-        words = text.split()
-        if not words:
-            return []
-        chunks = []
-        step = max(1, chunk_size - overlap)
-        i = 0
-        while i < len(words):
-            end = min(i + chunk_size, len(words))
-            chunk_words = words[i:end]
-            chunks.append(" ".join(chunk_words))
-            i += step
-            if i >= len(words):
-                break
-        return chunks
+        return list(iter_word_chunks([text], chunk_size=chunk_size, overlap=overlap))
     else:
         raise ValueError("method must be 'char' or 'word'")
 
@@ -1,15 +1,15 @@
 # backend/services/qa_engine.py
-import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 load_dotenv()
 from services.vector_store import query_similar_chunks
-from services.embeddings import get_embeddings_for_chunks
+from services.embeddings import embed_query
+from services.answer_cache import get_semantic_cache
+from services.llm_client import get_llm_client
+from services.executor import run_io
+from services.context_builder import pack_context
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")  # default model
-
-if not GROQ_API_KEY:
-    print("[WARN] GROQ_API_KEY not set — generation will fail until set in .env")
+NO_INFO_ANSWER = "I don't have information about this in the provided documents."
 
 def _build_prompt(context: str, question: str) -> str:
     prompt = f"""
@@ -30,76 +30,135 @@ ANSWER:
 """
     return prompt
 
-def _call_groq_chat(prompt: str) -> str:
-    # Use the official groq client if installed, otherwise fallback to requests
-    try:
-        from groq import Groq
-        client = Groq(api_key=GROQ_API_KEY)
-        resp = client.chat.completions.create(
-            model=GROQ_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=512
-        )
-        # depending on client version:
-        content = resp.choices[0].message.content
-        return content
-    except Exception:
-        # fallback via HTTP request (lightweight). If groq client not installed.
-        import requests, json
-        url = "https://api.groq.com/v1/chat/completions"
-        headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
-        body = {
-            "model": GROQ_MODEL,
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": 512
-        }
-        r = requests.post(url, headers=headers, data=json.dumps(body), timeout=30)
-        r.raise_for_status()
-        j = r.json()
-        # try to parse response
-        return j["choices"][0]["message"]["content"]
-
-def generate_answer_with_groq(question: str, top_k: int = 5) -> str:
+async def _call_groq_chat(prompt: str) -> str:
+    return await get_llm_client().chat([{"role": "user", "content": prompt}], max_tokens=512)
+
+async def _stream_groq_chat(prompt: str) -> AsyncIterator[str]:
+    async for delta in get_llm_client().stream_chat([{"role": "user", "content": prompt}], max_tokens=512):
+        yield delta
+
+def _build_context(matches) -> str:
+    # Whole chunks, best first, within the prompt token budget (see context_builder)
+    context, stats = pack_context(matches)
+    print(f"[INFO] Context: {stats['chunks_packed']} chunks, {stats['tokens_used']}/{stats['token_budget']} tokens "
+          f"({stats['chunks_duplicate']} duplicate, {stats['chunks_over_budget']} over budget)")
+    return context
+
+async def generate_answer_with_groq(question: str, top_k: int = 5, query_embedding: Optional[List[float]] = None,
+                              where: Optional[Dict[str, Any]] = None, use_cache: bool = True) -> str:
     """
     High-level: embed question, fetch top-k chunks from Chroma, combine into context,
-    call Groq to generate answer.
+    call Groq to generate answer. Pass query_embedding to skip the embedding step,
+    and `where` (see vector_store.build_filter) to search only matching chunks.
+    With use_cache, a paraphrase of a recent question that retrieves the same
+    chunks reuses that answer instead of calling Groq.
     """
+    answer, _ = await answer_with_sources(question, top_k=top_k, query_embedding=query_embedding,
+                                          where=where, use_cache=use_cache)
+    return answer
+
+
+async def answer_with_sources(question: str, top_k: int = 5, query_embedding: Optional[List[float]] = None,
+                              where: Optional[Dict[str, Any]] = None,
+                              use_cache: bool = True) -> Tuple[str, List[Dict[str, Any]]]:
+    """generate_answer_with_groq plus the source_summary of the retrieved chunks."""
     if not question or not question.strip():
         raise ValueError("Question cannot be empty")
 
     # 1) Embed question
-    q_embed = get_embeddings_for_chunks([question], use_cache=True, batch=False)[0]
+    q_embed = query_embedding
+    if q_embed is None:
+        q_embed = await embed_query(question)
 
     # 2) Query vector store
-    matches = query_similar_chunks(q_embed, top_k=top_k)
+    matches = await run_io(query_similar_chunks, q_embed, top_k=top_k, where=where)
     if not matches:
-        return "I don't have information about this in the provided documents."
-
-    # 3) Build context - keep within token/char budget (simple char-trim)
-    context_lines = []
-    total_chars = 0
-    MAX_CHARS = int(os.getenv("MAX_CONTEXT_CHARS", "3000"))
-    for m in matches:
-        text = (m.metadata.get("text") if m.metadata else "") or ""
-        if not text:
-            continue
-        if total_chars + len(text) > MAX_CHARS:
-            remaining = MAX_CHARS - total_chars
-            if remaining > 50:
-                context_lines.append(text[:remaining])
-            break
-        context_lines.append(text)
-        total_chars += len(text)
-
-    context = "\n\n".join(context_lines)
+        return NO_INFO_ANSWER, []
+    sources = source_summary(matches)
+
+    semantic_cache = get_semantic_cache() if use_cache else None
+    chunk_ids = [m.id for m in matches]
+    if semantic_cache is not None:
+        cached = semantic_cache.get(q_embed, chunk_ids)
+        if cached is not None:
+            return cached, sources
+
+    # 3) Build context
+    context = _build_context(matches)
     if not context.strip():
-        return "I don't have information about this in the provided documents."
+        return NO_INFO_ANSWER, sources
 
     # 4) build prompt and call Groq
     prompt = _build_prompt(context, question)
     try:
-        answer = _call_groq_chat(prompt)
+        answer = await _call_groq_chat(prompt)
+    except Exception as e:
+        raise RuntimeError(f"Generation error: {e}")
+
+    answer = answer.strip()
+    if semantic_cache is not None:
+        semantic_cache.put(q_embed, chunk_ids, answer)
+    return answer, sources
+
+
+def source_summary(matches) -> List[Dict[str, Any]]:
+    """What a client needs to cite the retrieved chunks (no chunk text)."""
+    sources = []
+    for i, m in enumerate(matches):
+        meta = m.metadata or {}
+        sources.append({
+            "rank": i + 1,
+            "id": m.id,
+            "score": m.score,
+            "doc_id": meta.get("doc_id"),
+            "filename": meta.get("filename"),
+            "page": meta.get("page"),
+        })
+    return sources
+
+async def stream_answer_with_groq(question: str, top_k: int = 5, query_embedding: Optional[List[float]] = None,
+                                  where: Optional[Dict[str, Any]] = None,
+                                  use_cache: bool = True) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streaming counterpart of generate_answer_with_groq. Yields (event, data):
+    ("sources", [...]) once retrieval is done, then ("token", delta) per
+    Groq delta, then ("done", {"answer": full_text, "cached": bool}).
+    A semantic cache hit is sent as a single token event.
+    """
+    if not question or not question.strip():
+        raise ValueError("Question cannot be empty")
+
+    q_embed = query_embedding
+    if q_embed is None:
+        q_embed = await embed_query(question)
+
+    matches = await run_io(query_similar_chunks, q_embed, top_k=top_k, where=where)
+    yield "sources", source_summary(matches)
+
+    context = _build_context(matches) if matches else ""
+    if not context.strip():
+        yield "token", NO_INFO_ANSWER
+        yield "done", {"answer": NO_INFO_ANSWER, "cached": False}
+        return
+
+    semantic_cache = get_semantic_cache() if use_cache else None
+    chunk_ids = [m.id for m in matches]
+    if semantic_cache is not None:
+        cached = semantic_cache.get(q_embed, chunk_ids)
+        if cached is not None:
+            yield "token", cached
+            yield "done", {"answer": cached, "cached": True}
+            return
+
+    parts = []
+    try:
+        async for delta in _stream_groq_chat(_build_prompt(context, question)):
+            parts.append(delta)
+            yield "token", delta
     except Exception as e:
         raise RuntimeError(f"Generation error: {e}")
 
-    return answer.strip()
+    answer = "".join(parts).strip()
+    if semantic_cache is not None and answer:
+        semantic_cache.put(q_embed, chunk_ids, answer)
+    yield "done", {"answer": answer, "cached": False}
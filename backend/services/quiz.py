@@ -0,0 +1,239 @@
+# backend/services/quiz.py
+"""Quiz generation from chunks already in the vector store.
+
+The topic is embedded and searched like a question (optionally scoped to a
+document / course), so nothing is re-uploaded or re-parsed. For several
+quiz sets the top QUIZ_CONTEXT_TOP_K * sets chunks are dealt round-robin,
+giving each set its own slice of the most relevant material. LLM calls run
+concurrently, at most QUIZ_MAX_CONCURRENT at a time.
+
+Every reply is validated against QuizQuestion. A set that fails validation
+is re-asked (with the validation error) up to QUIZ_MAX_ATTEMPTS times;
+sets that passed are never regenerated. Finished quizzes are cached per
+(scope, topic, sizes) until the corpus changes, like /answer responses.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, ValidationError, model_validator
+from dotenv import load_dotenv
+
+from services.embeddings import embed_query
+from services.vector_store import query_similar_chunks, build_filter, corpus_version
+from services.answer_cache import AnswerCache, normalize_question
+from services.context_builder import pack_context
+from services.qa_engine import source_summary
+from services.llm_client import get_llm_client, LLMError
+from services.executor import run_io, LoopSemaphore
+
+load_dotenv()
+
+QUIZ_MAX_CONCURRENT = int(os.getenv("QUIZ_MAX_CONCURRENT", "4"))
+QUIZ_CONTEXT_TOP_K = int(os.getenv("QUIZ_CONTEXT_TOP_K", "6"))
+QUIZ_CONTEXT_TOKENS = int(os.getenv("QUIZ_CONTEXT_TOKENS", "1500"))
+QUIZ_MAX_TOKENS = int(os.getenv("QUIZ_MAX_TOKENS", "1024"))
+QUIZ_MAX_ATTEMPTS = int(os.getenv("QUIZ_MAX_ATTEMPTS", "3"))
+QUIZ_CACHE_MAX_ENTRIES = int(os.getenv("QUIZ_CACHE_MAX_ENTRIES", "256"))
+QUIZ_CACHE_TTL_SECONDS = float(os.getenv("QUIZ_CACHE_TTL_SECONDS", "86400"))
+
+
+class QuizError(Exception):
+    pass
+
+
+class QuizValidationError(QuizError):
+    pass
+
+
+class QuizQuestion(BaseModel):
+    question: str
+    options: List[str]
+    answer: str
+    explanation: str = ""
+
+    @model_validator(mode="after")
+    def _check(self):
+        if not self.question.strip():
+            raise ValueError("question is empty")
+        if len(self.options) != 4 or len({o.strip() for o in self.options}) != 4:
+            raise ValueError("options must be 4 distinct strings")
+        if self.answer not in self.options:
+            raise ValueError("answer must be one of the options")
+        return self
+
+
+class QuizStats:
+    def __init__(self):
+        self.sets_generated = 0
+        self.sets_failed = 0
+        self.llm_calls = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for k, v in counts.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {k: v for k, v in vars(self).items() if not k.startswith("_")}
+
+
+_stats = QuizStats()
+_cache = AnswerCache(QUIZ_CACHE_MAX_ENTRIES, QUIZ_CACHE_TTL_SECONDS)
+_llm_limit = LoopSemaphore(QUIZ_MAX_CONCURRENT)
+
+
+def _quiz_prompt(topic: str, context: str, num_questions: int) -> str:
+    return f"""
+You MUST return ONLY valid JSON.
+
+Create {num_questions} multiple-choice questions about the topic, using ONLY the course material below.
+Return a JSON array; each item has "question", "options" (4 strings), "answer" (one of the options)
+and "explanation".
+
+TOPIC: "{topic}"
+
+COURSE MATERIAL:
+{context}
+"""
+
+
+def parse_quiz(text: str, num_questions: int) -> List[Dict[str, Any]]:
+    """Validated questions from an LLM reply; raises QuizValidationError with the reason."""
+    text = re.sub(r"^```(?:json)?|```$", "", text.strip(), flags=re.MULTILINE).strip()
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end < start:
+        raise QuizValidationError("reply contains no JSON array")
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError as e:
+        raise QuizValidationError(f"invalid JSON: {e}")
+    if not isinstance(items, list) or len(items) != num_questions:
+        raise QuizValidationError(f"expected {num_questions} questions, got {len(items) if isinstance(items, list) else 0}")
+    try:
+        return [QuizQuestion.model_validate(item).model_dump() for item in items]
+    except ValidationError as e:
+        raise QuizValidationError(f"schema error: {e.errors()[0].get('msg')}")
+
+
+async def retrieve_topic_chunks(topic: str, top_k: int, doc_id: Optional[str] = None,
+                                course_id: Optional[str] = None):
+    where = build_filter(doc_id=doc_id, course_id=course_id)
+    qvec = await embed_query(topic)
+    return await run_io(query_similar_chunks, qvec, top_k=top_k, where=where)
+
+
+async def _generate_set(topic: str, matches, num_questions: int) -> Dict[str, Any]:
+    context, stats = pack_context(matches, token_budget=QUIZ_CONTEXT_TOKENS)
+    if not context.strip():
+        raise QuizError("Retrieved chunks have no text")
+    messages = [{"role": "user", "content": _quiz_prompt(topic, context, num_questions)}]
+    for attempt in range(max(1, QUIZ_MAX_ATTEMPTS)):
+        async with _llm_limit.get():
+            text = await get_llm_client().chat(messages, max_tokens=QUIZ_MAX_TOKENS)
+        _stats.add(llm_calls=1, retries=1 if attempt else 0)
+        try:
+            questions = parse_quiz(text, num_questions)
+        except QuizValidationError as e:
+            print(f"[WARN] Quiz set for '{topic}' failed validation (attempt {attempt + 1}): {e}")
+            # Re-ask this set only, showing the model what was wrong.
+            messages = messages[:1] + [
+                {"role": "assistant", "content": text},
+                {"role": "user", "content": f"That reply was invalid ({e}). Return ONLY the JSON array "
+                                            f"of exactly {num_questions} questions."},
+            ]
+            continue
+        _stats.add(sets_generated=1)
+        return {"questions": questions, "sources": source_summary(matches),
+                "context_tokens": stats["tokens_used"], "attempts": attempt + 1}
+    _stats.add(sets_failed=1)
+    raise QuizValidationError(f"Quiz set failed validation after {QUIZ_MAX_ATTEMPTS} attempts")
+
+
+async def generate_quizzes(topic: str, doc_id: Optional[str] = None, course_id: Optional[str] = None,
+                           num_questions: int = 5, num_sets: int = 1) -> List[Dict[str, Any]]:
+    """`num_sets` quiz sets on `topic`, each built from a different slice of the retrieved chunks.
+
+    A set that still fails after its re-asks is returned as `{"error": ...}` in
+    its place; the call raises only if every set failed.
+    """
+    if not topic or not topic.strip():
+        raise ValueError("Topic cannot be empty")
+    num_sets = max(1, num_sets)
+    key = (normalize_question(topic), doc_id, course_id, num_questions, num_sets, corpus_version())
+    cached = _cache.get(key)
+    if cached is not None:
+        _stats.add(cache_hits=1)
+        return cached
+    _stats.add(cache_misses=1)
+
+    matches = await retrieve_topic_chunks(topic, QUIZ_CONTEXT_TOP_K * num_sets, doc_id=doc_id, course_id=course_id)
+    if not matches:
+        raise QuizError("No indexed content found for this topic")
+    slices = [matches[i::num_sets] for i in range(num_sets)]
+    results = await asyncio.gather(*(_generate_set(topic, s, num_questions) for s in slices),
+                                   return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    for err in errors:
+        if not isinstance(err, (QuizError, LLMError)):
+            raise err
+    if len(errors) == len(results):
+        raise errors[0]
+    if errors:
+        # Partial result: failed sets stay in place as error entries, and it is not cached.
+        print(f"[WARN] {len(errors)} of {len(results)} quiz sets for '{topic}' failed: {errors[0]}")
+    else:
+        _cache.put(key, results)
+    return [{"error": str(r)} if isinstance(r, BaseException) else r for r in results]
+
+
+async def generate_quiz_batch(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Run many quiz requests at once; one item failing does not fail the batch.
+
+    An item whose sets only partly failed is marked "partial"; `sets_failed`
+    counts every requested set that did not validate.
+    """
+    started = time.perf_counter()
+    before = _stats.snapshot()
+
+    async def run(item):
+        try:
+            sets = await generate_quizzes(**item)
+            partial = any("error" in s for s in sets)
+            return {**item, "status": "partial" if partial else "success", "quiz_sets": sets}
+        except (QuizError, LLMError, ValueError) as e:
+            return {**item, "status": "failed", "error": str(e)}
+
+    results = await asyncio.gather(*(run(item) for item in items))
+    elapsed = time.perf_counter() - started
+    after = _stats.snapshot()
+    delta = {k: after[k] - before[k] for k in after}  # approximate if other requests overlap
+    sets_requested = sum(max(1, item.get("num_sets", 1)) for item in items)
+    sets_done = sum(1 for r in results for s in r.get("quiz_sets", ()) if "error" not in s)
+    return {
+        "results": results,
+        "stats": {
+            "items": len(items),
+            "items_failed": sum(r["status"] == "failed" for r in results),
+            "items_partial": sum(r["status"] == "partial" for r in results),
+            "sets_generated": sets_done,
+            "sets_failed": sets_requested - sets_done,
+            "llm_calls": delta["llm_calls"],
+            "retries": delta["retries"],
+            "cache_hits": delta["cache_hits"],
+            "elapsed_seconds": round(elapsed, 3),
+            "sets_per_second": round(sets_done / elapsed, 2) if elapsed > 0 else 0.0,
+        },
+    }
+
+
+def get_quiz_stats() -> Dict[str, Any]:
+    return {**_stats.snapshot(), "cache": _cache.stats()}
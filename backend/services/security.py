@@ -0,0 +1,98 @@
+# backend/services/security.py
+"""Password hashing off the event loop, and short-lived session tokens.
+
+bcrypt releases the GIL while hashing, so hashes run on a dedicated thread
+pool of AUTH_HASH_WORKERS threads. That caps how many CPU cores a login
+spike can take, and queued logins wait there instead of stalling other
+requests. BCRYPT_ROUNDS sets the cost of new hashes; existing hashes keep
+the cost they were created with.
+
+After a successful login the client gets a signed session token (HS256,
+SESSION_TTL_SECONDS) and presents it as `Authorization: Bearer <token>`
+instead of re-sending credentials.
+"""
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+import bcrypt
+import jwt
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "900"))
+SESSION_ALGORITHM = "HS256"
+
+if not SESSION_SECRET:
+    # Tokens then only survive until restart and are not valid across workers.
+    SESSION_SECRET = os.urandom(32).hex()
+    print("[WARN] SESSION_SECRET not set — using a random per-process secret")
+
+
+class SessionError(Exception):
+    pass
+
+
+_hash_pool: Optional[ThreadPoolExecutor] = None
+_hash_lock = threading.Lock()
+
+
+def _get_hash_pool() -> ThreadPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        with _hash_lock:
+            if _hash_pool is None:
+                _hash_pool = ThreadPoolExecutor(max_workers=max(1, AUTH_HASH_WORKERS), thread_name_prefix="bcrypt")
+    return _hash_pool
+
+
+def hash_password_sync(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=rounds)).decode()
+
+
+def verify_password_sync(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode(), hashed.encode())
+    except ValueError:
+        return False  # malformed stored hash
+
+
+async def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_hash_pool(), hash_password_sync, password, rounds)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_hash_pool(), verify_password_sync, password, hashed)
+
+
+def create_session_token(user_id: Any, claims: Optional[Dict[str, Any]] = None,
+                         ttl_seconds: int = SESSION_TTL_SECONDS) -> str:
+    now = int(time.time())
+    payload = {**(claims or {}), "sub": str(user_id), "iat": now, "exp": now + ttl_seconds}
+    return jwt.encode(payload, SESSION_SECRET, algorithm=SESSION_ALGORITHM)
+
+
+def verify_session_token(token: str) -> Dict[str, Any]:
+    """Claims of a valid, unexpired token; raises SessionError otherwise."""
+    try:
+        return jwt.decode(token, SESSION_SECRET, algorithms=[SESSION_ALGORITHM], options={"require": ["exp", "sub"]})
+    except jwt.ExpiredSignatureError:
+        raise SessionError("Session expired")
+    except jwt.InvalidTokenError as e:
+        raise SessionError(f"Invalid session token: {e}")
+
+
+def shutdown_hash_pool():
+    global _hash_pool
+    with _hash_lock:
+        if _hash_pool is not None:
+            _hash_pool.shutdown(wait=False, cancel_futures=True)
+            _hash_pool = None
@@ -0,0 +1,156 @@
+# backend/services/users.py
+"""Data access for the users table.
+
+Every query names the columns it needs instead of `SELECT *`. Signup is a
+single INSERT that relies on the UNIQUE index on users.email, so a
+duplicate fails atomically with no read-then-write race. The index is
+created on first use if an older schema lacks it. Calls are blocking and
+run on the IO pool via the async wrappers.
+
+Routes use the async UserStore returned by get_user_store(). USER_STORE=sql
+(default) uses these queries against DB_BACKEND (MySQL or the SQLite shim).
+USER_STORE=memory keeps users in a process-local dict for tests and demos.
+"""
+import os
+import threading
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+from services.database import db_cursor, get_pool, DuplicateKeyError, DB_BACKEND
+from services.executor import run_io
+
+load_dotenv()
+
+USER_STORE = os.getenv("USER_STORE", "sql").strip().lower()
+
+
+class UserExistsError(Exception):
+    pass
+
+
+_schema_checked = False
+_schema_lock = threading.Lock()
+
+
+def ensure_email_index():
+    """Add the UNIQUE index on users.email (MySQL) if it is missing; the SQLite shim creates it."""
+    global _schema_checked
+    if _schema_checked:
+        return
+    with _schema_lock:
+        if _schema_checked:
+            return
+        get_pool()
+        if DB_BACKEND == "mysql":
+            with db_cursor(commit=True) as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() "
+                    "AND table_name = 'users' AND column_name = 'email' AND non_unique = 0 LIMIT 1"
+                )
+                if cursor.fetchone() is None:
+                    print("[INFO] Adding UNIQUE index on users.email")
+                    try:
+                        cursor.execute("ALTER TABLE users ADD UNIQUE INDEX uq_users_email (email)")
+                    except Exception as e:
+                        # e.g. duplicate emails already stored; signup still works, just without the guarantee
+                        print(f"[WARN] Could not add UNIQUE index on users.email: {e}")
+        _schema_checked = True
+
+
+def get_credentials(email: str) -> Optional[Dict[str, Any]]:
+    """id, fullName and password hash for a login, or None."""
+    ensure_email_index()
+    with db_cursor() as cursor:
+        cursor.execute("SELECT id, fullName, password FROM users WHERE email = %s LIMIT 1", (email,))
+        return cursor.fetchone()
+
+
+def create_user(full_name: str, email: str, hashed_pw: str) -> int:
+    """Insert a user and return its id; raises UserExistsError if the email is taken."""
+    ensure_email_index()
+    try:
+        with db_cursor(commit=True) as cursor:
+            cursor.execute(
+                "INSERT INTO users (fullName, email, password) VALUES (%s, %s, %s)",
+                (full_name, email, hashed_pw)
+            )
+            return cursor.lastrowid
+    except DuplicateKeyError:
+        raise UserExistsError("Email already registered")
+
+
+async def aget_credentials(email: str) -> Optional[Dict[str, Any]]:
+    return await run_io(get_credentials, email)
+
+
+async def acreate_user(full_name: str, email: str, hashed_pw: str) -> int:
+    return await run_io(create_user, full_name, email, hashed_pw)
+
+
+class UserStore:
+    """Async user persistence used by the auth routes."""
+
+    name = "base"
+
+    async def get_credentials(self, email: str) -> Optional[Dict[str, Any]]:
+        """{"id", "fullName", "email", "password"} for a login, or None."""
+        raise NotImplementedError
+
+    async def create_user(self, full_name: str, email: str, hashed_pw: str) -> Any:
+        """New user's id; raises UserExistsError if the email is taken."""
+        raise NotImplementedError
+
+
+class SQLUserStore(UserStore):
+    name = "sql"
+
+    async def get_credentials(self, email):
+        user = await aget_credentials(email)
+        return {**user, "email": email} if user else None
+
+    async def create_user(self, full_name, email, hashed_pw):
+        return await acreate_user(full_name, email, hashed_pw)
+
+
+class MemoryUserStore(UserStore):
+    """Process-local store; users vanish on restart and are not shared across workers."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._by_email: Dict[str, Dict[str, Any]] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    async def get_credentials(self, email):
+        with self._lock:
+            user = self._by_email.get(email)
+            return dict(user) if user else None
+
+    async def create_user(self, full_name, email, hashed_pw):
+        with self._lock:
+            if email in self._by_email:
+                raise UserExistsError("Email already registered")
+            user = {"id": self._next_id, "fullName": full_name, "email": email, "password": hashed_pw}
+            self._next_id += 1
+            self._by_email[email] = user
+            return user["id"]
+
+
+_store: Optional[UserStore] = None
+_store_lock = threading.Lock()
+
+
+def get_user_store() -> UserStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if USER_STORE == "sql":
+                    _store = SQLUserStore()
+                elif USER_STORE == "memory":
+                    _store = MemoryUserStore()
+                else:
+                    raise ValueError(f"Unknown USER_STORE '{USER_STORE}' (expected sql or memory)")
+                print(f"[INFO] User store: {_store.name}")
+    return _store
@@ -1,37 +1,296 @@
 # backend/services/vector_store.py
 import os
-from typing import List, Tuple, Dict, Any
+import json
+import time
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Tuple, Dict, Any, Optional
 from dotenv import load_dotenv
 
+from services.metrics import VECTOR_SECONDS
+
 load_dotenv()
 
 INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "smart")
 EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "384"))
+# Metadata fields uploads can be tagged with and searches can be scoped by
+FILTER_FIELDS = ("course_id", "doc_id", "owner_id")
+# chroma | numpy
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").strip().lower()
+# Empty = in-memory store (lost on restart). CHROMA_PERSIST_DIR is the older name.
+VECTOR_PERSIST_DIR = os.getenv("VECTOR_PERSIST_DIR") or os.getenv("CHROMA_PERSIST_DIR", "")
+
+_backend = None
+_init_lock = threading.Lock()
+_load_seconds = None
+_count = None  # cached collection size; reset on every write
+_corpus_version = 0  # bumped on every write; keys caches of derived results (answers)
+_version_lock = threading.Lock()
+# doc_id -> summary of the last complete ingestion of that document (cleared with the collection)
+_documents: Dict[str, Dict[str, Any]] = {}
+# doc_hash -> a doc_id holding vectors for that content
+_doc_hashes: Dict[str, str] = {}
+
+
+class VectorBackend:
+    """Storage interface behind upsert_embeddings / query_embeddings.
+
+    Scores follow the Chroma convention used by /query: 1 / (1 + squared L2
+    distance), which for normalized embeddings is 1 / (3 - 2 * cosine).
+    `where` is a flat {field: value} equality filter (see build_filter).
+    """
+    name = "base"
+
+    def add(self, ids: List[str], embeddings: List[List[float]], metadatas: List[Dict[str, Any]]) -> int:
+        raise NotImplementedError
+
+    def query(self, query_vector: List[float], top_k: int,
+              where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def query_batch(self, query_vectors: List[List[float]], top_k: int,
+                    where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        return [self.query(vec, top_k, where=where) for vec in query_vectors]
+
+    def get_metadata(self, where: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_vectors(self, where: Dict[str, Any]) -> Tuple[List[str], List[List[float]], List[Dict[str, Any]]]:
+        raise NotImplementedError
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> int:
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]) -> int:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def clear(self) -> int:
+        raise NotImplementedError
+
+    def info(self) -> Dict[str, Any]:
+        return {}
+
+
+class ChromaBackend(VectorBackend):
+    name = "chroma"
+
+    def __init__(self, persist_dir: str = ""):
+        try:
+            import chromadb
+            from chromadb.config import Settings
+        except Exception as e:
+            raise ImportError("chromadb is required. Install with: pip install chromadb") from e
+
+        self.persist_dir = persist_dir
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+            self._client = chromadb.PersistentClient(path=persist_dir)
+        else:
+            try:
+                self._client = chromadb.Client(Settings())
+            except TypeError:
+                self._client = chromadb.Client()
+        self._collection = self._client.get_or_create_collection(name=INDEX_NAME)
+
+    def add(self, ids, embeddings, metadatas):
+        documents = [meta.get("text") or "" for meta in metadatas]
+        res = self._collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+        return len(res.get("ids", ids)) if isinstance(res, dict) else len(ids)
+
+    @staticmethod
+    def _where(where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if not where:
+            return None
+        if len(where) == 1:
+            return dict(where)
+        return {"$and": [{k: v} for k, v in where.items()]}
+
+    def query(self, query_vector, top_k, where=None):
+        return self.query_batch([query_vector], top_k, where=where)[0]
+
+    def query_batch(self, query_vectors, top_k, where=None):
+        # Chroma applies `where` as a metadata pre-filter before scoring.
+        resp = self._collection.query(
+            query_embeddings=query_vectors,
+            n_results=top_k,
+            where=self._where(where),
+            include=["metadatas", "distances", "documents"]
+        )
+        return [self._format_results(resp, qi) for qi in range(len(query_vectors))]
+
+    @staticmethod
+    def _format_results(resp, qi: int) -> List[Dict[str, Any]]:
+        def column(key):
+            values = resp.get(key) or []
+            return (values[qi] if qi < len(values) else None) or []
+
+        ids = column("ids")
+        metadatas = column("metadatas")
+        distances = column("distances")
+
+        results = []
+        for i, _id in enumerate(ids):
+            dist = distances[i] if i < len(distances) else None
+            meta = metadatas[i] if i < len(metadatas) else {}
+            score = None
+            if dist is not None:
+                try:
+                    score = 1.0 / (1.0 + float(dist))
+                except Exception:
+                    score = None
+            results.append({"id": _id, "score": score, "metadata": meta})
+        return results
+
+    def get_metadata(self, where):
+        resp = self._collection.get(where=self._where(where), include=["metadatas"])
+        return dict(zip(resp.get("ids", []), resp.get("metadatas", [])))
+
+    def get_vectors(self, where):
+        resp = self._collection.get(where=self._where(where), include=["embeddings", "metadatas"])
+        embeddings = resp.get("embeddings")
+        return (list(resp.get("ids", [])), [list(map(float, e)) for e in (embeddings if embeddings is not None else [])],
+                list(resp.get("metadatas", [])))
+
+    def update_metadata(self, ids, metadatas):
+        self._collection.update(ids=ids, metadatas=metadatas)
+        return len(ids)
+
+    def delete(self, ids):
+        self._collection.delete(ids=ids)
+        return len(ids)
+
+    def count(self):
+        return self._collection.count()
+
+    def clear(self):
+        try:
+            count = self._collection.count()
+        except Exception:
+            count = 0
+        try:
+            self._client.delete_collection(name=INDEX_NAME)
+        except Exception:
+            try:
+                self._collection.delete()
+            except Exception:
+                pass
+        self._collection = self._client.create_collection(name=INDEX_NAME)
+        return count
+
+
+def _create_backend() -> VectorBackend:
+    if VECTOR_BACKEND == "numpy":
+        from services.numpy_index import NumpyVectorIndex
+        return NumpyVectorIndex(INDEX_NAME, EMBEDDING_DIMENSION, VECTOR_PERSIST_DIR)
+    if VECTOR_BACKEND != "chroma":
+        raise ValueError(f"Unknown VECTOR_BACKEND '{VECTOR_BACKEND}' (expected 'chroma' or 'numpy')")
+    return ChromaBackend(VECTOR_PERSIST_DIR)
+
+def _documents_file() -> Optional[Path]:
+    return Path(VECTOR_PERSIST_DIR) / f"{INDEX_NAME}.documents.json" if VECTOR_PERSIST_DIR else None
+
+def _load_documents():
+    path = _documents_file()
+    if path is None or not path.exists():
+        return
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            _documents.update(json.load(f))
+    except Exception as e:
+        print(f"[WARN] Failed to load document registry: {e}")
+    _index_documents()
 
-_client = None
-_collection = None
+def _index_documents():
+    _doc_hashes.clear()
+    for doc_id, info in _documents.items():
+        _doc_hashes[info["doc_hash"]] = doc_id
 
-def init_chroma():
-    global _client, _collection
-    if _client and _collection:
-        return _collection
+def _save_documents():
+    path = _documents_file()
+    if path is None:
+        return
     try:
-        import chromadb
-        from chromadb.config import Settings
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_documents, f)
+        os.replace(tmp, path)
     except Exception as e:
-        raise ImportError("chromadb is required. Install with: pip install chromadb") from e
+        print(f"[WARN] Failed to save document registry: {e}")
+
+def init_vector_store() -> VectorBackend:
+    global _backend, _load_seconds
+    if _backend is not None:
+        return _backend
+    with _init_lock:
+        if _backend is not None:
+            return _backend
+        start = time.perf_counter()
+        backend = _create_backend()
+        _load_documents()
+        _load_seconds = time.perf_counter() - start
+        _backend = backend
+        mode = f"persistent at {VECTOR_PERSIST_DIR}" if VECTOR_PERSIST_DIR else "in-memory"
+        print(f"[INFO] {backend.name} vector store initialized (collection: {INDEX_NAME}, {mode}) "
+              f"in {_load_seconds * 1000:.1f} ms")
+    return _backend
+
+# Kept for existing callers; the store is no longer necessarily Chroma.
+init_chroma = init_vector_store
+
+def vector_count() -> int:
+    global _count
+    cached = _count
+    if cached is not None:
+        return cached
+    version = _corpus_version
+    count = init_vector_store().count()
+    with _version_lock:
+        # Only cache a count no write overlapped; a mid-write count is returned but not kept.
+        if version == _corpus_version:
+            _count = count
+    return count
 
+def corpus_version() -> int:
+    return _corpus_version
+
+def _bump_version():
+    global _count, _corpus_version
+    with _version_lock:
+        _count = None
+        _corpus_version += 1
+
+@contextmanager
+def _writing():
+    """Bump the version before and after a write.
+
+    A reader that captured the version before or during the write holds a
+    version that is stale once the write lands, so nothing it derives from
+    old data can be cached as current (even if the write fails half-way).
+    """
+    _bump_version()
     try:
-        _client = chromadb.Client(Settings())
-    except TypeError:
-        _client = chromadb.Client()
+        yield
+    finally:
+        _bump_version()
 
-    _collection = _client.get_or_create_collection(name=INDEX_NAME)
-    print(f"[INFO] ChromaDB initialized (collection: {INDEX_NAME})")
-    return _collection
+def get_store_info() -> Dict[str, Any]:
+    return {
+        "backend": VECTOR_BACKEND,
+        "collection": INDEX_NAME,
+        "persistent": bool(VECTOR_PERSIST_DIR),
+        "loaded": _backend is not None,
+        "load_ms": round(_load_seconds * 1000, 1) if _load_seconds is not None else None,
+        "documents": len(_documents),
+        "corpus_version": _corpus_version,
+        **(_backend.info() if _backend is not None else {}),
+    }
 
 def upsert_embeddings(vectors: List[Tuple[str, List[float], Dict[str, Any]]]) -> int:
-    collection = init_chroma()
+    backend = init_vector_store()
     if not vectors:
         print("[WARN] No vectors to upsert")
         return 0
@@ -39,50 +298,99 @@ def upsert_embeddings(vectors: List[Tuple[str, List[float], Dict[str, Any]]]) ->
     ids = [vid for vid, _, _ in vectors]
     embeddings = [vec for _, vec, _ in vectors]
     metadatas = [meta if isinstance(meta, dict) else {"text": str(meta)} for _, _, meta in vectors]
-    documents = [meta.get("text") if isinstance(meta, dict) and meta.get("text") else "" for _, _, meta in vectors]
 
-    res = collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
-    upserted = len(res.get("ids", ids)) if isinstance(res, dict) else len(ids)
-    print(f"[INFO] Upserted {upserted} vectors into Chroma collection")
+    with _writing(), VECTOR_SECONDS.time(op="upsert"):
+        upserted = backend.add(ids, embeddings, metadatas)
+    print(f"[INFO] Upserted {upserted} vectors into {backend.name} store")
     return upserted
 
-def store_embeddings(embeddings: List[List[float]], chunks: List[str]) -> int:
+def store_embeddings(embeddings: List[List[float]], chunks: List[str], start_index: int = 0,
+                     ids: Optional[List[str]] = None, metadatas: Optional[List[Dict[str, Any]]] = None) -> int:
     if len(embeddings) != len(chunks):
         raise ValueError("Mismatch: embeddings count vs chunks count")
-    vectors = [(f"chunk-{i}", emb, {"text": chunk}) for i, (emb, chunk) in enumerate(zip(embeddings, chunks))]
+    if ids is None:
+        ids = [f"chunk-{start_index + i}" for i in range(len(chunks))]
+    elif len(ids) != len(chunks):
+        raise ValueError("Mismatch: ids count vs chunks count")
+    metadatas = metadatas or [{} for _ in chunks]
+    vectors = [(vid, emb, {**meta, "text": chunk}) for vid, emb, chunk, meta in zip(ids, embeddings, chunks, metadatas)]
     return upsert_embeddings(vectors)
 
-def query_embeddings(query_vector: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
-    collection = init_chroma()
+def get_document_chunks(doc_id: str) -> Dict[str, Dict[str, Any]]:
+    """id -> metadata for every stored chunk of a document."""
+    return init_vector_store().get_metadata({"doc_id": doc_id})
+
+def get_document_vectors(doc_id: str) -> Tuple[List[str], List[List[float]], List[Dict[str, Any]]]:
+    """(ids, embeddings, metadatas) of every stored chunk of a document."""
+    return init_vector_store().get_vectors({"doc_id": doc_id})
+
+def update_metadata(ids: List[str], metadatas: List[Dict[str, Any]]) -> int:
+    if not ids:
+        return 0
+    backend = init_vector_store()
+    with _writing(), VECTOR_SECONDS.time(op="update_metadata"):
+        return backend.update_metadata(ids, metadatas)
+
+def delete_embeddings(ids: List[str]) -> int:
+    if not ids:
+        return 0
+    backend = init_vector_store()
+    with _writing(), VECTOR_SECONDS.time(op="delete"):
+        deleted = backend.delete(ids)
+    print(f"[INFO] Deleted {deleted} vectors from {backend.name} store")
+    return deleted
+
+def get_document(doc_id: str) -> Optional[Dict[str, Any]]:
+    init_vector_store()  # the registry is loaded with the store
+    return _documents.get(doc_id)
+
+def register_document(doc_id: str, info: Dict[str, Any]) -> None:
+    _documents[doc_id] = info
+    _index_documents()
+    _save_documents()
+
+def find_document_by_hash(doc_hash: str) -> Optional[str]:
+    """doc_id already holding vectors for identical content (same bytes and settings), if any."""
+    init_vector_store()
+    return _doc_hashes.get(doc_hash)
+
+def build_filter(**fields: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Equality filter over FILTER_FIELDS from keyword args; None values are ignored."""
+    unknown = set(fields) - set(FILTER_FIELDS)
+    if unknown:
+        raise ValueError(f"Unsupported filter fields: {sorted(unknown)}")
+    where = {k: v for k, v in fields.items() if v is not None and v != ""}
+    return where or None
+
+def query_embeddings(query_vector: List[float], top_k: int = 5,
+                     where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    backend = init_vector_store()
     if len(query_vector) != EMBEDDING_DIMENSION:
         print(f"[WARN] Query vector dimension {len(query_vector)} != EMBEDDING_DIMENSION {EMBEDDING_DIMENSION}")
 
-    resp = collection.query(
-        query_embeddings=[query_vector],
-        n_results=top_k,
-        include=["metadatas", "distances", "documents"]
-    )
-
-    ids = resp.get("ids", [[]])[0]
-    metadatas = resp.get("metadatas", [[]])[0]
-    distances = resp.get("distances", [[]])[0]
-
-    results = []
-    for i, _id in enumerate(ids):
-        dist = distances[i] if i < len(distances) else None
-        meta = metadatas[i] if i < len(metadatas) else {}
-        score = None
-        if dist is not None:
-            try:
-                score = 1.0 / (1.0 + float(dist))
-            except Exception:
-                score = None
-        results.append({"id": _id, "score": score, "metadata": meta})
+    with VECTOR_SECONDS.time(op="query"):
+        results = backend.query(query_vector, top_k, where=where)
     print(f"[INFO] Query returned {len(results)} matches")
     return results
 
-def query_similar_chunks(question_embedding: List[float], top_k: int = 5):
-    rows = query_embeddings(question_embedding, top_k)
+def query_embeddings_batch(query_vectors: List[List[float]], top_k: int = 5,
+                           where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+    """One vectorized search for many queries; returns ranked results per query."""
+    if not query_vectors:
+        return []
+    backend = init_vector_store()
+    bad = [len(v) for v in query_vectors if len(v) != EMBEDDING_DIMENSION]
+    if bad:
+        print(f"[WARN] {len(bad)} query vectors have dimension != EMBEDDING_DIMENSION {EMBEDDING_DIMENSION}")
+
+    with VECTOR_SECONDS.time(op="query_batch"):
+        results = backend.query_batch(query_vectors, top_k, where=where)
+    print(f"[INFO] Batch query of {len(query_vectors)} vectors returned {sum(len(r) for r in results)} matches")
+    return results
+
+def query_similar_chunks(question_embedding: List[float], top_k: int = 5,
+                         where: Optional[Dict[str, Any]] = None):
+    rows = query_embeddings(question_embedding, top_k, where=where)
     class Match:
         def __init__(self, d):
             self.id = d.get("id")
@@ -91,23 +399,15 @@ def query_similar_chunks(question_embedding: List[float], top_k: int = 5):
     return [Match(r) for r in rows]
 
 def clear_index() -> int:
-    global _collection, _client
-    col = init_chroma()
-    try:
-        count = _collection.count()
-    except Exception:
-        count = 0
-    print(f"[WARN] Clearing collection '{INDEX_NAME}' with ~{count} vectors...")
-    try:
-        _client.delete_collection(name=INDEX_NAME)
-    except Exception:
-        try:
-            _collection.delete()
-        except Exception:
-            pass
-    _collection = _client.create_collection(name=INDEX_NAME)
-    print("[INFO] Collection recreated successfully")
+    backend = init_vector_store()
+    print(f"[WARN] Clearing collection '{INDEX_NAME}' ({backend.name})...")
+    with _writing():
+        count = backend.clear()
+        _documents.clear()
+        _index_documents()
+        _save_documents()
+    print(f"[INFO] Collection recreated successfully ({count} vectors removed)")
     return count
 
-def get_or_create_index():
-    return init_chroma()
+def get_or_create_index() -> VectorBackend:
+    return init_vector_store()